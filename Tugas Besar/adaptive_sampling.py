@@ -0,0 +1,200 @@
+"""
+Adaptive sample_rate for the video pipelines in app_backend.py and app_helmet.py
+Instead of a fixed inference stride, the stride is re-planned about once a second from the
+measured cost of a frame without inference (decode / track / draw / encode) and of one
+inferred sample, so a run holds a processing speed target or finishes within a deadline
+"""
+
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class SamplingConfigError(ValueError):
+    """Invalid adaptive sampling settings"""
+
+class SampleRateController:
+    """
+    Inference stride controller for one video run at a time
+    target_fps is the wanted processing speed in video frames per wall-clock second; deadline
+    asks to finish within deadline x the clip duration and is re-planned from the frames and
+    time left (clips of unknown length use fps / deadline). Every interval seconds the stride
+    becomes the smallest one whose predicted speed meets the target,
+        frame_cost + inferred_share * inference_cost / sample_rate <= 1 / target_fps,
+    with both costs smoothed over the previous windows, inferred_share the fraction of sampled
+    frames that actually ran inference (the rest reuse detections through motion gating) and the
+    stride at most halved or doubled per step. The first interval (model / decoder start-up) is
+    not measured. Every change is logged and kept in decisions (at most max_decisions)
+    """
+    
+    def __init__(self, sample_rate=5, target_fps=0.0, deadline=0.0, min_rate=1, max_rate=30,
+                 interval=1.0, smoothing=0.5, max_decisions=200):
+        if target_fps < 0 or deadline < 0 or (target_fps > 0) == (deadline > 0):
+            raise SamplingConfigError('Set exactly one of target_fps or deadline (> 0) for adaptive sampling')
+        if not 1 <= min_rate <= max_rate:
+            raise SamplingConfigError('Adaptive sample rate bounds need 1 <= min_sample_rate <= max_sample_rate')
+        self.initial_rate = min(max(int(sample_rate), min_rate), max_rate)
+        self.target_fps = target_fps
+        self.deadline = deadline
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.interval = interval
+        self.smoothing = smoothing
+        self.max_decisions = max_decisions
+        # observe_inference and update come from different pipeline threads
+        self._lock = threading.Lock()
+        self.start()
+    
+    @classmethod
+    def from_config(cls, config, sample_rate=5, max_rate=30):
+        """
+        Controller from a request options dict (target_fps or deadline, min_sample_rate,
+        max_sample_rate), None when neither target is set and sample_rate stays fixed
+        """
+        try:
+            target_fps = float(config.get('target_fps') or 0)
+            deadline = float(config.get('deadline') or 0)
+            if target_fps <= 0 and deadline <= 0:
+                return None
+            return cls(
+                sample_rate=sample_rate,
+                target_fps=max(target_fps, 0.0),
+                deadline=max(deadline, 0.0),
+                min_rate=int(config.get('min_sample_rate', 1)),
+                max_rate=int(config.get('max_sample_rate', max_rate)),
+            )
+        except (TypeError, ValueError) as e:
+            if isinstance(e, SamplingConfigError):
+                raise
+            raise SamplingConfigError(f"Invalid adaptive sampling settings: {e}")
+    
+    def start(self, fps=30.0, total_frames=0):
+        """Reset for a new run of a clip with this frame rate / frame count (0 = unknown)"""
+        self.fps = fps or 30.0
+        self.total_frames = total_frames
+        self.sample_rate = self.initial_rate
+        self.started = time.perf_counter()
+        self.inference_seconds = 0.0
+        self.sampled = 0
+        self.samples = 0
+        self.inference_cost = None
+        self.frame_cost = None
+        self.decisions = []
+        self.changes = 0
+        self._window = None
+    
+    def describe(self):
+        """JSON-friendly settings, also used in result cache keys"""
+        return {
+            'target_fps': self.target_fps,
+            'deadline': self.deadline,
+            'min_sample_rate': self.min_rate,
+            'max_sample_rate': self.max_rate,
+        }
+    
+    def key(self):
+        return ','.join(f"{name}={value}" for name, value in sorted(self.describe().items()))
+    
+    def observe_sample(self, samples=1):
+        """Count sampled frames, inferred or reusing the previous detections"""
+        with self._lock:
+            self.sampled += samples
+    
+    def inferred_share(self):
+        """Fraction of the sampled frames that ran inference (1.0 before any sample)"""
+        return min(self.samples / self.sampled, 1.0) if self.sampled else 1.0
+    
+    def observe_inference(self, seconds, samples=1):
+        """Record the latency of one forward pass over samples frames"""
+        with self._lock:
+            self.inference_seconds += seconds
+            self.samples += samples
+            cost = seconds / max(samples, 1)
+            self.inference_cost = cost if self.inference_cost is None else (
+                self.smoothing * self.inference_cost + (1 - self.smoothing) * cost)
+    
+    def current_target(self, done_frames, elapsed):
+        """Processing FPS needed from now on"""
+        if self.target_fps > 0:
+            return self.target_fps
+        if self.total_frames <= 0:
+            return self.fps / self.deadline
+        time_left = self.deadline * self.total_frames / self.fps - elapsed
+        if time_left <= 0:
+            return math.inf
+        return max(self.total_frames - done_frames, 0) / time_left
+    
+    def update(self, done_frames):
+        """Called as frames finish; re-plans the stride once per interval, returns the current stride"""
+        with self._lock:
+            now = time.perf_counter()
+            if self._window is None:
+                # Start-up window: the first frames pay for decoder and model warm-up
+                if now - self.started >= self.interval and self.inference_cost is not None:
+                    self._window = (now, done_frames, self.inference_seconds)
+                return self.sample_rate
+            window_start, window_frames, window_inference = self._window
+            if now - window_start < self.interval or done_frames <= window_frames or self.inference_cost is None:
+                return self.sample_rate
+            
+            frames = done_frames - window_frames
+            window_time = now - window_start
+            # Inference overlaps the other stages in the threaded pipeline, this is the remaining cost
+            cost = max(window_time - (self.inference_seconds - window_inference), 0.0) / frames
+            self.frame_cost = cost if self.frame_cost is None else (
+                self.smoothing * self.frame_cost + (1 - self.smoothing) * cost)
+            self._window = (now, done_frames, self.inference_seconds)
+            
+            elapsed = now - self.started
+            target = self.current_target(done_frames, elapsed)
+            budget = 1.0 / target if target > 0 else math.inf
+            if budget <= self.frame_cost:
+                # Even without inference the target is out of reach, infer as rarely as allowed
+                rate = self.max_rate
+            elif math.isinf(budget):
+                rate = self.min_rate
+            else:
+                # Samples that reuse detections cost no forward pass
+                rate = math.ceil(self.inferred_share() * self.inference_cost / (budget - self.frame_cost))
+            rate = min(max(rate, self.sample_rate // 2, self.min_rate), self.sample_rate * 2, self.max_rate)
+            
+            if rate != self.sample_rate:
+                decision = {
+                    'frame': done_frames,
+                    'time_s': round(elapsed, 2),
+                    'sample_rate': rate,
+                    'previous_sample_rate': self.sample_rate,
+                    'measured_fps': round(frames / window_time, 2),
+                    'target_fps': round(target, 2) if math.isfinite(target) else None,
+                    'inference_ms': round(self.inference_cost * 1000, 2),
+                    'frame_ms': round(self.frame_cost * 1000, 2),
+                    'inferred_share': round(self.inferred_share(), 3),
+                }
+                logger.info(f"Adaptive sampling: sample_rate {self.sample_rate} -> {rate} at frame {done_frames} "
+                            f"({decision['measured_fps']} FPS, target {decision['target_fps']})")
+                self.sample_rate = rate
+                self.changes += 1
+                if len(self.decisions) < self.max_decisions:
+                    self.decisions.append(decision)
+            return self.sample_rate
+    
+    def stats(self, done_frames):
+        """Settings, outcome and the logged stride changes of the current run"""
+        elapsed = time.perf_counter() - self.started
+        duration = self.total_frames / self.fps if self.total_frames else done_frames / self.fps
+        return {
+            **self.describe(),
+            'initial_sample_rate': self.initial_rate,
+            'final_sample_rate': self.sample_rate,
+            'sampled_frames': self.sampled,
+            'inferred_samples': self.samples,
+            # Frames per sample (the stride) and per forward pass, apart with motion gating
+            'average_sample_rate': round(done_frames / self.sampled, 2) if self.sampled else None,
+            'average_inference_rate': round(done_frames / self.samples, 2) if self.samples else None,
+            'processing_fps': round(done_frames / elapsed, 2) if elapsed > 0 else None,
+            'deadline_met': elapsed <= self.deadline * duration if self.deadline > 0 else None,
+            'changes': self.changes,
+            'decisions': self.decisions,
+        }
@@ -6,16 +6,40 @@ import DetectionStats from '@/components/DetectionStats';
 import ComplianceStatus from '@/components/ComplianceStatus';
 import LoadingIndicator from '@/components/LoadingIndicator';
 
+interface DetectionBox {
+  class_id: number;
+  class: string;
+  confidence: number;
+  box: [number, number, number, number]; // normalized x1, y1, x2, y2
+  track_id?: number;
+}
+
 interface DetectionResult {
   with_helmet: number;
   no_helmet: number;
   motorcycle: number;
   details: any[];
+  boxes?: DetectionBox[];
 }
 
+const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:5000';
+const WS_URL = `${API_URL.replace(/^http/, 'ws')}/ws/camera`;
+const STREAM_INTERVAL_MS = 100;
+const POLL_INTERVAL_MS = 2000;
+
+// Same colors as CLASS_COLORS in the backend
+const CLASS_COLORS: Record<number, string> = {
+  0: '#00ff00', // with_helmet - Green
+  1: '#ff0000', // no_helmet - Red
+  2: '#ffa500', // motorcycle - Orange
+};
+
 export default function CameraDetection() {
   const videoRef = useRef<HTMLVideoElement>(null);
   const canvasRef = useRef<HTMLCanvasElement>(null);
+  const overlayRef = useRef<HTMLCanvasElement>(null);
+  const wsRef = useRef<WebSocket | null>(null);
+  const awaitingResultRef = useRef(false);
   const [cameraActive, setCameraActive] = useState(false);
   const [result, setResult] = useState<DetectionResult | null>(null);
   const [loading, setLoading] = useState(false);
@@ -38,11 +62,7 @@ export default function CameraDetection() {
         setCameraActive(true);
         setError(null);
 
-        // Start detection every 2 seconds
-        const interval = setInterval(() => {
-          captureAndDetect();
-        }, 2000);
-        setDetectionInterval(interval);
+        startStreaming();
       }
     } catch (err) {
       const errorMsg =
@@ -63,36 +83,136 @@ export default function CameraDetection() {
       clearInterval(detectionInterval);
       setDetectionInterval(null);
     }
+
+    if (wsRef.current) {
+      wsRef.current.close();
+      wsRef.current = null;
+    }
   };
 
-  const captureAndDetect = async () => {
-    if (!videoRef.current || !canvasRef.current) return;
+  // Stream JPEG frames over a WebSocket, fall back to HTTP polling if it cannot connect
+  const startStreaming = () => {
+    const ws = new WebSocket(WS_URL);
+    let opened = false;
+    wsRef.current = ws;
+    awaitingResultRef.current = false;
 
-    try {
-      const context = canvasRef.current.getContext('2d');
-      if (!context) return;
+    ws.onopen = () => {
+      opened = true;
+      ws.send(JSON.stringify({ confidence_threshold: confidence, track: true }));
+
+      const interval = setInterval(() => {
+        // Send the next frame only after the previous result came back
+        if (ws.readyState !== WebSocket.OPEN || awaitingResultRef.current) return;
+        captureFrame()?.toBlob((blob) => {
+          if (blob && ws.readyState === WebSocket.OPEN) {
+            awaitingResultRef.current = true;
+            ws.send(blob);
+          }
+        }, 'image/jpeg', 0.8);
+      }, STREAM_INTERVAL_MS);
+      setDetectionInterval(interval);
+    };
+
+    ws.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      if (message.type === 'detections') {
+        awaitingResultRef.current = false;
+        setResult(message);
+        drawOverlay(message.boxes || []);
+      } else if (message.type === 'error') {
+        awaitingResultRef.current = false;
+        console.error('Stream error:', message.error);
+      }
+    };
+
+    ws.onerror = () => {
+      if (!opened) {
+        console.warn('WebSocket unavailable, falling back to HTTP polling');
+        wsRef.current = null;
+        const interval = setInterval(() => {
+          captureAndDetect();
+        }, POLL_INTERVAL_MS);
+        setDetectionInterval(interval);
+      }
+    };
+  };
+
+  const captureFrame = () => {
+    if (!videoRef.current || !canvasRef.current) return null;
 
-      canvasRef.current.width = videoRef.current.videoWidth;
-      canvasRef.current.height = videoRef.current.videoHeight;
+    const context = canvasRef.current.getContext('2d');
+    if (!context) return null;
 
-      context.drawImage(videoRef.current, 0, 0);
+    canvasRef.current.width = videoRef.current.videoWidth;
+    canvasRef.current.height = videoRef.current.videoHeight;
+
+    context.drawImage(videoRef.current, 0, 0);
+    return canvasRef.current;
+  };
+
+  const captureAndDetect = async () => {
+    try {
+      const canvas = captureFrame();
+      if (!canvas) return;
 
-      const imageData = canvasRef.current.toDataURL('image/jpeg');
+      const imageData = canvas.toDataURL('image/jpeg');
 
       const response = await axios.post<DetectionResult>(
-        `${process.env.NEXT_PUBLIC_API_URL || 'http://localhost:5000'}/api/detect-image`,
+        `${API_URL}/api/detect-image`,
         {
           image: imageData,
           confidence_threshold: confidence,
+          mode: 'boxes',
         }
       );
 
       setResult(response.data);
+      drawOverlay(response.data.boxes || []);
     } catch (err) {
       console.error('Detection error:', err);
     }
   };
 
+  // Draw boxes client-side, the backend only returns normalized coordinates
+  const drawOverlay = (boxes: DetectionBox[]) => {
+    const overlay = overlayRef.current;
+    if (!overlay) return;
+
+    overlay.width = overlay.clientWidth;
+    overlay.height = overlay.clientHeight;
+    const context = overlay.getContext('2d');
+    if (!context) return;
+
+    context.clearRect(0, 0, overlay.width, overlay.height);
+    context.lineWidth = 2;
+    context.font = '14px sans-serif';
+
+    boxes.forEach(({ class_id, class: className, confidence, box, track_id }) => {
+      const [x1, y1, x2, y2] = box;
+      const x = x1 * overlay.width;
+      const y = y1 * overlay.height;
+      const color = CLASS_COLORS[class_id] || '#ffffff';
+      const label = track_id !== undefined
+        ? `ID:${track_id} ${className} ${(confidence * 100).toFixed(0)}%`
+        : `${className} ${(confidence * 100).toFixed(0)}%`;
+
+      context.strokeStyle = color;
+      context.strokeRect(x, y, (x2 - x1) * overlay.width, (y2 - y1) * overlay.height);
+      context.fillStyle = color;
+      context.fillRect(x, y - 20, context.measureText(label).width + 8, 20);
+      context.fillStyle = '#ffffff';
+      context.fillText(label, x + 4, y - 5);
+    });
+  };
+
+  // Push threshold changes to the live stream session
+  useEffect(() => {
+    if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
+      wsRef.current.send(JSON.stringify({ confidence_threshold: confidence }));
+    }
+  }, [confidence]);
+
   useEffect(() => {
     return () => {
       stopCamera();
@@ -130,6 +250,7 @@ export default function CameraDetection() {
                   }
                 }}
               />
+              <canvas ref={overlayRef} className="absolute inset-0 w-full h-full pointer-events-none" />
               {cameraActive && (
                 <div className="absolute top-4 right-4 flex items-center gap-2 bg-red-500/20 px-3 py-2 rounded-lg border border-red-500/50">
                   <div className="w-2 h-2 bg-red-500 rounded-full animate-pulse"></div>
@@ -6,10 +6,22 @@ import DetectionStats from '@/components/DetectionStats';
 import ComplianceStatus from '@/components/ComplianceStatus';
 import LoadingIndicator from '@/components/LoadingIndicator';
 
+interface TrackSummary {
+  track_id: number;
+  class: string;
+  confidence: string;
+  first_seen_s: number;
+  last_seen_s: number;
+  samples: number;
+}
+
 interface DetectionResult {
+  // Unique tracked objects, detection_counts holds the per-frame sums
   with_helmet: number;
   no_helmet: number;
   motorcycle: number;
+  detection_counts?: { with_helmet: number; no_helmet: number; motorcycle: number };
+  tracks?: TrackSummary[];
   details: any[];
   preview_image?: string;
   video_path?: string;
@@ -18,11 +30,26 @@ interface DetectionResult {
   ffmpeg_converted?: boolean;
 }
 
+interface VideoJob {
+  job_id: string;
+  state: 'queued' | 'running' | 'done' | 'failed';
+  processed_frames: number;
+  total_frames: number;
+  progress: number;
+  eta_seconds: number | null;
+  result: DetectionResult | null;
+  error: string | null;
+}
+
+const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:5000';
+const JOB_POLL_INTERVAL_MS = 1000;
+
 export default function VideoDetection() {
   const [videoFile, setVideoFile] = useState<File | null>(null);
   const [videoPreview, setVideoPreview] = useState<string | null>(null);
   const [result, setResult] = useState<DetectionResult | null>(null);
   const [loading, setLoading] = useState(false);
+  const [job, setJob] = useState<VideoJob | null>(null);
   const [error, setError] = useState<string | null>(null);
   const [confidence, setConfidence] = useState(0.5);
   const [sampleRate, setSampleRate] = useState(5);
@@ -52,15 +79,19 @@ export default function VideoDetection() {
     setLoading(true);
     setError(null);
     setVideoError(false);
+    setJob(null);
 
     try {
+      // Fields go before the file so the backend can start decoding while the video uploads
       const formData = new FormData();
-      formData.append('video', videoFile);
       formData.append('confidence_threshold', confidence.toString());
       formData.append('sample_rate', sampleRate.toString());
+      formData.append('async', 'true');
+      formData.append('video', videoFile);
 
-      const response = await axios.post<DetectionResult>(
-        `${process.env.NEXT_PUBLIC_API_URL || 'http://localhost:5000'}/api/detect-video`,
+      // Upload returns a job id immediately, progress is polled from /api/jobs/<id>
+      const submitted = await axios.post<VideoJob>(
+        `${API_URL}/api/detect-video`,
         formData,
         {
           headers: {
@@ -69,17 +100,31 @@ export default function VideoDetection() {
         }
       );
 
-      setResult(response.data);
+      let currentJob = submitted.data;
+      while (currentJob.state === 'queued' || currentJob.state === 'running') {
+        await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+        const status = await axios.get<VideoJob>(`${API_URL}/api/jobs/${currentJob.job_id}`);
+        currentJob = status.data;
+        setJob(currentJob);
+      }
+
+      if (currentJob.state === 'failed' || !currentJob.result) {
+        throw new Error(currentJob.error || 'Terjadi kesalahan saat deteksi');
+      }
+
+      setResult(currentJob.result);
       
       // Set video URL with timestamp to force reload
-      if (response.data.video_path) {
-        const videoUrl = `${process.env.NEXT_PUBLIC_API_URL || 'localhost:5000'}${response.data.video_path}?t=${Date.now()}`;
+      if (currentJob.result.video_path) {
+        const videoUrl = `${API_URL}${currentJob.result.video_path}?t=${Date.now()}`;
         setProcessedVideoUrl(videoUrl);
       }
     } catch (err) {
       const errorMsg = axios.isAxiosError(err)
         ? err.response?.data?.error || 'Terjadi kesalahan saat deteksi'
-        : 'Terjadi kesalahan';
+        : err instanceof Error
+          ? err.message
+          : 'Terjadi kesalahan';
       setError(errorMsg);
       console.error('Detection error:', err);
     } finally {
@@ -175,14 +220,14 @@ export default function VideoDetection() {
                 <input
                   type="range"
                   min="1"
-                  max="10"
+                  max="15"
                   step="1"
                   value={sampleRate}
                   onChange={(e) => setSampleRate(parseInt(e.target.value))}
                   className="w-full h-2 bg-slate-700 rounded-lg appearance-none cursor-pointer accent-cyan-500"
                 />
                 <p className="text-xs text-slate-400 mt-2">
-                  📊 Semakin tinggi = lebih cepat (tapi akurasi berkurang), semakin rendah = lebih akurat (lebih lambat)
+                  📊 Semakin tinggi = lebih cepat, box di frame antara sampel diinterpolasi dari tracking; semakin rendah = lebih akurat (lebih lambat)
                 </p>
               </div>
             </div>
@@ -217,7 +262,16 @@ export default function VideoDetection() {
           <div className="bg-slate-800/40 backdrop-blur border border-slate-700/50 rounded-2xl p-8">
             <h2 className="text-2xl font-bold text-slate-100 mb-6">📹 Preview & Hasil</h2>
 
-            {loading && <LoadingIndicator message="🎯 Processing video..." />}
+            {loading && (
+              <LoadingIndicator
+                message={
+                  job && job.total_frames > 0
+                    ? `🎯 Processing video... ${job.processed_frames}/${job.total_frames} frames` +
+                      (job.eta_seconds !== null ? ` (ETA ${Math.ceil(job.eta_seconds)}s)` : '')
+                    : '🎯 Processing video...'
+                }
+              />
+            )}
 
             {error && (
               <div className="bg-red-500/10 text-red-400 p-5 rounded-xl border border-red-500/30 flex gap-3">
@@ -314,7 +368,36 @@ export default function VideoDetection() {
                       />
                     </div>
 
-                    {result.details && result.details.length > 0 && (
+                    {result.tracks && result.tracks.length > 0 && (
+                      <div>
+                        <h3 className="font-bold text-slate-100 mb-3">🏍️ Objek Unik ({result.tracks.length})</h3>
+                        <div className="bg-slate-900/50 rounded-lg border border-slate-700/50 max-h-64 overflow-y-auto">
+                          <div className="space-y-2 p-4">
+                            {result.tracks.slice(0, 50).map((track) => (
+                              <div
+                                key={track.track_id}
+                                className="bg-slate-800/50 p-2 rounded border border-slate-700/30 text-xs text-slate-300"
+                              >
+                                <span className="text-slate-400">ID {track.track_id}</span>
+                                <span className="text-slate-500"> • </span>
+                                <span className="font-medium text-slate-100">{track.class}</span>
+                                <span className="text-slate-500"> • </span>
+                                <span className="text-blue-400">{track.confidence}</span>
+                                <span className="text-slate-500"> • </span>
+                                <span className="text-slate-400">
+                                  {track.first_seen_s.toFixed(1)}s – {track.last_seen_s.toFixed(1)}s
+                                </span>
+                              </div>
+                            ))}
+                            {result.tracks.length > 50 && (
+                              <p className="text-xs text-slate-400 pt-2">+{result.tracks.length - 50} lebih banyak</p>
+                            )}
+                          </div>
+                        </div>
+                      </div>
+                    )}
+
+                    {!result.tracks && result.details && result.details.length > 0 && (
                       <div>
                         <h3 className="font-bold text-slate-100 mb-3">📋 Detail Deteksi</h3>
                         <div className="bg-slate-900/50 rounded-lg border border-slate-700/50 max-h-64 overflow-y-auto">
@@ -0,0 +1,83 @@
+"""
+Shared detection overlay drawing for app_backend.py and app_helmet.py
+Box data is pulled out of an ultralytics Results once as NumPy arrays (one device-to-host copy),
+label text sizes are cached and boxes are drawn in place on the frame that is passed in
+"""
+
+import functools
+
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+# Hershey digits all have the same advance width
+_ZERO_DIGITS = str.maketrans('123456789', '000000000')
+
+class BoxStyle:
+    """Class names/colors and label geometry of one app's overlay"""
+    
+    def __init__(self, class_names, class_colors, font_scale=0.6, thickness=2, box_thickness=2,
+                 label_height=25, label_offset=5):
+        self.class_names = class_names
+        self.class_colors = class_colors
+        self.font_scale = font_scale
+        self.thickness = thickness
+        self.box_thickness = box_thickness
+        self.label_height = label_height
+        self.label_offset = label_offset
+
+def result_arrays(result):
+    """
+    (xyxy (N, 4), class ids (N,), confidences (N,), track ids (N,) or None) of a Results object
+    Boxes.data is [x1, y1, x2, y2, (track_id,) conf, cls] per row, copied to host once
+    """
+    boxes = result.boxes
+    data = boxes.data.cpu().numpy()
+    track_ids = data[:, 4].astype(int) if boxes.is_track else None
+    return data[:, :4], data[:, -1].astype(int), data[:, -2], track_ids
+
+@functools.lru_cache(maxsize=1024)
+def _text_width(text, font_scale, thickness):
+    return cv2.getTextSize(text, FONT, font_scale, thickness)[0][0]
+
+def label_width(label, font_scale, thickness):
+    """
+    Pixel width of label, cached per class / font (digits are zeroed in the cache key,
+    so confidences and track ids of the same length share one entry)
+    """
+    return _text_width(label.translate(_ZERO_DIGITS), font_scale, thickness)
+
+def draw_boxes(image, style, boxes, classes, confs, track_ids=None):
+    """Draw xyxy boxes with '[ID:n] class conf%' labels onto image in place, returns image"""
+    if len(boxes) == 0:
+        return image
+    
+    # Plain Python ints/floats, so the loop does no per-box NumPy scalar conversions
+    corners = np.asarray(boxes).astype(int).tolist()
+    classes = np.asarray(classes).astype(int).tolist()
+    confs = np.asarray(confs, dtype=float).tolist()
+    track_ids = np.asarray(track_ids).astype(int).tolist() if track_ids is not None else [-1] * len(corners)
+    
+    for (x1, y1, x2, y2), cls_id, conf, track_id in zip(corners, classes, confs, track_ids):
+        color = style.class_colors.get(cls_id, (255, 255, 255))
+        
+        # Draw bounding box
+        cv2.rectangle(image, (x1, y1), (x2, y2), color, style.box_thickness)
+        
+        # Draw label
+        label = f"{style.class_names.get(cls_id, 'unknown')} {conf:.2%}"
+        if track_id >= 0:
+            label = f"ID:{track_id} {label}"
+        width = label_width(label, style.font_scale, style.thickness)
+        cv2.rectangle(image, (x1, y1 - style.label_height), (x1 + width, y1), color, -1)
+        cv2.putText(image, label, (x1, y1 - style.label_offset),
+                    FONT, style.font_scale, (255, 255, 255), style.thickness)
+    
+    return image
+
+def draw_results(image, style, results):
+    """Draw the boxes (with track ids for model.track results) of every Results onto image in place"""
+    for result in results:
+        boxes, classes, confs, track_ids = result_arrays(result)
+        draw_boxes(image, style, boxes, classes, confs, track_ids)
+    return image
@@ -3,24 +3,61 @@ Helmet Detection API Backend
 Flask server dengan FFmpeg untuk video encoding yang browser-compatible
 """
 
-from flask import Flask, request, jsonify, send_file, Response
+import time
+_startup_started = time.perf_counter()
+
+from flask import Flask, request, jsonify, send_file, Response, g
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_range_header
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
+from werkzeug.security import safe_join
 from flask_cors import CORS
 import cv2
 import numpy as np
 import base64
+import hashlib
+import json
+import re
 from pathlib import Path
-from ultralytics import YOLO
 import tempfile
 import os
 import uuid
 import subprocess
 import shutil
+import queue
+import threading
+import contextlib
+import itertools
+import multiprocessing as mp
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+from inference_worker import InferenceWorkerPool, set_inference_threads
+from video_tracking import BoxTracker, UniqueObjectCounter, interpolate_tracks
+from annotation import BoxStyle, draw_boxes, result_arrays
+from region_inference import DetectionRegion, RegionConfigError, load_camera_configs
+from motion_gating import MotionConfigError, MotionGate
+from adaptive_sampling import SampleRateController, SamplingConfigError
 
 # Create temp video directory if not exists
 TEMP_VIDEO_DIR = Path("temp_videos")
 TEMP_VIDEO_DIR.mkdir(exist_ok=True)
 import logging
-import torch
 import warnings
 
 # Suppress warnings
@@ -31,14 +68,36 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})
+CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=['X-Detections'])
+
+# WebSocket support for live camera streaming (pip install flask-sock)
+sock = Sock(app) if Sock is not None else None
+if sock is None:
+    logger.warning("⚠️ flask-sock not installed, /ws/camera streaming disabled")
 
-# Monkey patch torch.load for PyTorch 2.6+ compatibility
-_original_torch_load = torch.load
-def patched_torch_load(f, *args, **kwargs):
-    kwargs.setdefault('weights_only', False)
-    return _original_torch_load(f, *args, **kwargs)
-torch.load = patched_torch_load
+# Startup timings in seconds (reported in the log and by /health)
+startup_timings = {'imports': round(time.perf_counter() - _startup_started, 3)}
+
+def import_inference_libraries():
+    """
+    Import torch + ultralytics on first use (the bulk of the import time) and patch torch.load
+    Returns the YOLO class
+    """
+    start = time.perf_counter()
+    import torch
+    from ultralytics import YOLO
+    
+    # Monkey patch torch.load for PyTorch 2.6+ compatibility
+    if not getattr(torch.load, '_weights_only_patched', False):
+        original_torch_load = torch.load
+        def patched_torch_load(f, *args, **kwargs):
+            kwargs.setdefault('weights_only', False)
+            return original_torch_load(f, *args, **kwargs)
+        patched_torch_load._weights_only_patched = True
+        torch.load = patched_torch_load
+    
+    startup_timings.setdefault('inference_imports', round(time.perf_counter() - start, 3))
+    return YOLO
 
 # Check if FFmpeg is available
 def check_ffmpeg():
@@ -56,20 +115,83 @@ def check_ffmpeg():
         logger.warning("Install FFmpeg: apt-get install ffmpeg (Linux) or download from ffmpeg.org (Windows)")
     return False
 
-FFMPEG_AVAILABLE = check_ffmpeg()
+_ffmpeg_available = None
+_ffmpeg_probe_lock = threading.Lock()
+
+def ffmpeg_available():
+    """Cached FFmpeg probe, check_ffmpeg() runs once on first use instead of blocking import"""
+    global _ffmpeg_available
+    with _ffmpeg_probe_lock:
+        if _ffmpeg_available is None:
+            start = time.perf_counter()
+            _ffmpeg_available = check_ffmpeg()
+            startup_timings['ffmpeg_probe'] = round(time.perf_counter() - start, 3)
+    return _ffmpeg_available
+
+# Inference backend: 'pytorch' (best.pt), 'onnx' (best.onnx), 'onnx_int8' (best_int8.onnx, see quantize_model.py)
+# or 'openvino' (best_openvino_model/)
+MODEL_BACKEND = os.environ.get('MODEL_BACKEND', 'pytorch').lower()
+MODEL_PATHS = {
+    'pytorch': Path("results/helmet_balanced/weights/best.pt"),
+    'onnx': Path("results/helmet_balanced/weights/best.onnx"),
+    'onnx_int8': Path("results/helmet_balanced/weights/best_int8.onnx"),
+    'openvino': Path("results/helmet_balanced/weights/best_openvino_model"),
+}
+# Intra-op CPU threads for inference (0 = library default, or CPU cores / INFERENCE_WORKERS per worker)
+INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', 0))
+
+# Inference worker processes, each with its own model (0 = run the model inside the Flask process)
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', 0))
+
+# Startup (start_backend(), run when the module is imported): 'eager' loads and warms up the model
+# before the import returns, 'background' does it in a thread so the server accepts connections
+# immediately (/health answers 503 until the model is warmed up)
+STARTUP_MODE = os.environ.get('STARTUP_MODE', 'eager').lower()
+WARMUP_RUNS = int(os.environ.get('WARMUP_RUNS', 2))
+WARMUP_IMAGE_SIZE = int(os.environ.get('WARMUP_IMAGE_SIZE', 640))
+
+def configure_inference_threads(model, backend, model_path):
+    """Apply INFERENCE_THREADS to torch and, for ONNX / OpenVINO models, to the runtime session"""
+    if INFERENCE_THREADS <= 0:
+        return
+    
+    try:
+        set_inference_threads(model, model_path, INFERENCE_THREADS)
+        if backend.startswith('onnx'):
+            logger.info(f"✅ ONNX Runtime using {INFERENCE_THREADS} intra-op threads")
+        elif backend == 'openvino':
+            logger.info(f"✅ OpenVINO using {INFERENCE_THREADS} inference threads")
+    except Exception as e:
+        logger.warning(f"⚠️ Could not set the {backend} inference thread count: {e}")
 
 # Load model with fallback
-def load_detection_model():
-    """Load model with automatic fallback to yolov11n if custom model fails"""
-    MODEL_PATH = Path("results/helmet_balanced/weights/best.pt")
+def load_detection_model(backend=None):
+    """
+    Load model for the selected backend (MODEL_BACKEND by default)
+    Falls back to the PyTorch checkpoint if the exported model is missing, then to yolov11n
+    Returns (model, backend, model_path)
+    """
+    YOLO = import_inference_libraries()
+    backend = backend or MODEL_BACKEND
+    if backend not in MODEL_PATHS:
+        logger.warning(f"⚠️ Unknown MODEL_BACKEND '{backend}', using pytorch")
+        backend = 'pytorch'
+    
+    candidates = [(backend, MODEL_PATHS[backend])]
+    if backend != 'pytorch':
+        candidates.append(('pytorch', MODEL_PATHS['pytorch']))
     
     # Try loading custom model first
-    if MODEL_PATH.exists():
+    for candidate_backend, model_path in candidates:
+        if not model_path.exists():
+            logger.warning(f"⚠️ {candidate_backend} model not found at {model_path}")
+            continue
         try:
-            logger.info(f"Loading custom model from {MODEL_PATH}...")
-            model = YOLO(str(MODEL_PATH))
+            logger.info(f"Loading custom {candidate_backend} model from {model_path}...")
+            model = YOLO(str(model_path), task='detect')
+            configure_inference_threads(model, candidate_backend, model_path)
             logger.info("✅ Custom helmet detection model loaded successfully")
-            return model
+            return model, candidate_backend, model_path
         except Exception as e:
             logger.warning(f"⚠️ Custom model loading failed: {e}")
     
@@ -77,13 +199,169 @@ def load_detection_model():
     try:
         logger.info("Loading YOLOv11 nano model (auto-downloading)...")
         model = YOLO('yolov11n')
+        configure_inference_threads(model, 'pytorch', None)
         logger.info("✅ YOLOv11 nano model loaded successfully")
-        return model
+        return model, 'pytorch', Path('yolov11n')
     except Exception as e:
         logger.error(f"❌ Failed to load any model: {e}")
-        return None
+        return None, None, None
+
+# Set by initialize_model() (during the import in eager mode, from a thread in background mode)
+model, model_backend, model_path = None, None, None
+model_ready = threading.Event()
+
+# Video batching settings (0 = auto-size from available RAM)
+VIDEO_BATCH_SIZE = int(os.environ.get('VIDEO_BATCH_SIZE', 0))
+MAX_VIDEO_BATCH_SIZE = 16
+VIDEO_BATCH_RAM_FRACTION = 0.25
+
+# Max frames buffered between video pipeline stages (decode -> inference -> encode)
+PIPELINE_QUEUE_SIZE = int(os.environ.get('PIPELINE_QUEUE_SIZE', 32))
+_PIPELINE_DONE = object()
+
+# Boxes on frames between samples are interpolated from IoU tracks; a track is dropped after
+# TRACK_MAX_MISSED_SAMPLES sampled frames without a matching detection
+TRACK_MAX_MISSED_SAMPLES = int(os.environ.get('TRACK_MAX_MISSED_SAMPLES', 2))
+TRACK_IOU_THRESHOLD = float(os.environ.get('TRACK_IOU_THRESHOLD', 0.3))
+
+# Async video job settings
+VIDEO_JOB_WORKERS = int(os.environ.get('VIDEO_JOB_WORKERS', 2))
+MAX_PENDING_VIDEO_JOBS = int(os.environ.get('MAX_PENDING_VIDEO_JOBS', 16))
+VIDEO_JOB_TTL = int(os.environ.get('VIDEO_JOB_TTL', 3600))
+
+# Streamed video uploads: read from the request in UPLOAD_CHUNK_SIZE chunks, the container is
+# identified from the first UPLOAD_SNIFF_BYTES; FFmpeg gets STREAM_DECODE_TIMEOUT seconds to
+# produce the first frame of an upload that is still arriving
+UPLOAD_CHUNK_SIZE = 64 * 1024
+UPLOAD_SNIFF_BYTES = 64 * 1024
+STREAM_DECODE_TIMEOUT = int(os.environ.get('STREAM_DECODE_TIMEOUT', 120))
+
+# Video ingestion: VIDEO_DECODE_WIDTH > 0 has FFmpeg scale frames down to that width while decoding
+# (inference and the output video then run at that size, per request: decode_width), VIDEO_HWACCEL is
+# passed to FFmpeg -hwaccel (e.g. auto, cuda, vaapi, qsv, videotoolbox) for GPU decoding
+VIDEO_DECODE_WIDTH = int(os.environ.get('VIDEO_DECODE_WIDTH', 0))
+VIDEO_HWACCEL = os.environ.get('VIDEO_HWACCEL', '')
+
+# Analytics-only video runs (mode=analytics): no output video, frames are sampled at
+# ANALYTICS_SAMPLES_PER_SECOND timestamps; gaps longer than ANALYTICS_SEEK_GAP_S (about one GOP)
+# are crossed with a container seek, shorter ones by grabbing, which decodes fewer frames
+ANALYTICS_SAMPLES_PER_SECOND = float(os.environ.get('ANALYTICS_SAMPLES_PER_SECOND', 2))
+ANALYTICS_SEEK_GAP_S = float(os.environ.get('ANALYTICS_SEEK_GAP_S', 2))
 
-model = load_detection_model()
+# ROI / tiled inference for high-resolution cameras: CAMERA_CONFIG is a JSON file of per-camera
+# region settings selected with camera_id (requests can also pass roi / tiled / tile_size /
+# tile_overlap); TILE_BATCH_SIZE crops share one forward pass
+CAMERA_CONFIG = os.environ.get('CAMERA_CONFIG', '')
+TILE_BATCH_SIZE = int(os.environ.get('TILE_BATCH_SIZE', 8))
+CAMERA_CONFIGS = load_camera_configs(CAMERA_CONFIG)
+REGION_OPTIONS = ('roi', 'tiled', 'tile_size', 'tile_overlap', 'full_frame')
+
+# Motion gating of sampled video frames (MOTION_GATE = off / diff / mog2): a sample whose
+# MOTION_GATE_WIDTH-px grayscale copy changed on at most MOTION_THRESHOLD of its pixels reuses the
+# previous detections instead of running the model, at most MOTION_MAX_SKIP samples in a row.
+# Requests override these with motion_gate / motion_threshold / motion_pixel_threshold / motion_max_skip
+MOTION_GATE = os.environ.get('MOTION_GATE', 'off')
+MOTION_THRESHOLD = float(os.environ.get('MOTION_THRESHOLD', 0.002))
+MOTION_PIXEL_THRESHOLD = float(os.environ.get('MOTION_PIXEL_THRESHOLD', 25))
+MOTION_MAX_SKIP = int(os.environ.get('MOTION_MAX_SKIP', 25))
+MOTION_GATE_WIDTH = int(os.environ.get('MOTION_GATE_WIDTH', 320))
+MOTION_OPTIONS = ('motion_gate', 'motion_threshold', 'motion_pixel_threshold', 'motion_max_skip')
+
+# Adaptive sample_rate (requests with target_fps or deadline): the stride is re-planned from the
+# measured inference / frame costs, between min_sample_rate and ADAPTIVE_MAX_SAMPLE_RATE
+ADAPTIVE_MAX_SAMPLE_RATE = int(os.environ.get('ADAPTIVE_MAX_SAMPLE_RATE', 30))
+
+# Micro-batching for /api/detect-image: concurrent requests within the wait window share one forward pass
+IMAGE_MICRO_BATCHING = os.environ.get('IMAGE_MICRO_BATCHING', '1') == '1'
+IMAGE_BATCH_MAX_SIZE = int(os.environ.get('IMAGE_BATCH_MAX_SIZE', 8))
+IMAGE_BATCH_MAX_WAIT_MS = float(os.environ.get('IMAGE_BATCH_MAX_WAIT_MS', 10))
+
+# Result caches keyed on content hash + settings + model version (0 disables)
+IMAGE_CACHE_SIZE = int(os.environ.get('IMAGE_CACHE_SIZE', 256))
+IMAGE_CACHE_MAX_MB = float(os.environ.get('IMAGE_CACHE_MAX_MB', 64))
+VIDEO_CACHE_MAX_MB = float(os.environ.get('VIDEO_CACHE_MAX_MB', 2048))
+
+# Processed videos in TEMP_VIDEO_DIR: deleted VIDEO_OUTPUT_TTL seconds after creation, and oldest first
+# while the directory exceeds VIDEO_DIR_MAX_MB (0 disables either rule); the janitor runs every
+# VIDEO_JANITOR_INTERVAL seconds and never evicts a video younger than VIDEO_JANITOR_GRACE by quota
+VIDEO_OUTPUT_TTL = int(os.environ.get('VIDEO_OUTPUT_TTL', 24 * 3600))
+VIDEO_DIR_MAX_MB = float(os.environ.get('VIDEO_DIR_MAX_MB', 4096))
+VIDEO_JANITOR_INTERVAL = int(os.environ.get('VIDEO_JANITOR_INTERVAL', 300))
+VIDEO_JANITOR_GRACE = 300
+VIDEO_CHUNK_SIZE = 256 * 1024
+
+# YOLO predictor is not thread-safe, serialize forward passes between requests/jobs
+# (replaced by a no-op once INFERENCE_WORKERS processes are serving, each owns its model)
+inference_lock = threading.Lock()
+
+# /health/ready fails once this many images wait for the micro-batcher
+READY_MAX_IMAGE_QUEUE = int(os.environ.get('READY_MAX_IMAGE_QUEUE', IMAGE_BATCH_MAX_SIZE * 4))
+
+# Prometheus metrics for /metrics (pip install prometheus-client)
+if prometheus_client is not None:
+    STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+    
+    REQUEST_COUNT = prometheus_client.Counter(
+        'helmet_http_requests_total', 'HTTP requests', ['endpoint', 'method', 'status'])
+    REQUEST_LATENCY = prometheus_client.Histogram(
+        'helmet_http_request_duration_seconds', 'HTTP request latency', ['endpoint'])
+    STAGE_LATENCY = prometheus_client.Histogram(
+        'helmet_stage_duration_seconds', 'Processing time per image / video frame by stage',
+        ['pipeline', 'stage'], buckets=STAGE_BUCKETS)
+    VIDEO_FRAMES = prometheus_client.Counter(
+        'helmet_video_frames_processed_total', 'Video frames decoded, annotated and written')
+    VIDEO_FPS = prometheus_client.Gauge(
+        'helmet_video_fps', 'Throughput of the last processed video (frames/sec)')
+    FFMPEG_LATENCY = prometheus_client.Histogram(
+        'helmet_ffmpeg_seconds', 'FFmpeg encoding time per video (pipe) or conversion time (convert)',
+        ['mode'], buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+    prometheus_client.Gauge(
+        'helmet_temp_dir_bytes', 'Disk usage of TEMP_VIDEO_DIR (processed videos + video cache)'
+    ).set_function(lambda: directory_size(TEMP_VIDEO_DIR))
+    prometheus_client.Gauge(
+        'helmet_image_queue_depth', 'Images waiting for the micro-batcher'
+    ).set_function(lambda: image_queue_depth())
+    prometheus_client.Gauge(
+        'helmet_video_jobs_active', 'Queued + running async video jobs'
+    ).set_function(lambda: count_active_video_jobs())
+    prometheus_client.Gauge(
+        'helmet_ready', '1 when /health/ready passes'
+    ).set_function(lambda: 0 if readiness_problems() else 1)
+    prometheus_client.Gauge(
+        'helmet_inference_workers_alive', 'Running inference worker processes (INFERENCE_WORKERS)'
+    ).set_function(lambda: alive_inference_workers())
+
+def observe_stage(pipeline, stage, seconds, count=1):
+    """Record count items that took seconds in total in a pipeline stage"""
+    if prometheus_client is None:
+        return
+    histogram = STAGE_LATENCY.labels(pipeline, stage)
+    for _ in range(count):
+        histogram.observe(seconds / count)
+
+def observe_video_run(frames, wall_time):
+    """Record frames written by one video run and its throughput"""
+    if prometheus_client is None:
+        return
+    VIDEO_FRAMES.inc(frames)
+    if wall_time > 0:
+        VIDEO_FPS.set(frames / wall_time)
+
+def observe_ffmpeg(mode, seconds):
+    """Record FFmpeg time for one video ('pipe' or 'convert')"""
+    if prometheus_client is not None:
+        FFMPEG_LATENCY.labels(mode).observe(seconds)
+
+def directory_size(path):
+    """Total size in bytes of the files under path"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
 
 # Class mapping
 CLASS_NAMES = {
@@ -98,52 +376,131 @@ CLASS_COLORS = {
     2: (255, 165, 0)     # motorcycle - Orange
 }
 
-def decode_base64_image(image_string):
-    """Decode base64 image string to numpy array"""
+BOX_STYLE = BoxStyle(CLASS_NAMES, CLASS_COLORS)
+
+def decode_image_bytes(image_data):
+    """Decode encoded image bytes (JPEG/PNG) to numpy array"""
+    try:
+        image_array = np.frombuffer(image_data, dtype=np.uint8)
+        return cv2.imdecode(image_array, cv2.IMREAD_COLOR)
+    except Exception as e:
+        logger.error(f"Error decoding image: {e}")
+        return None
+
+def decode_base64_data(image_string):
+    """Decode base64 image string (optionally a data URL) to the encoded image bytes"""
     try:
         if ',' in image_string:
             image_string = image_string.split(',')[1]
         
-        image_data = base64.b64decode(image_string)
-        image_array = np.frombuffer(image_data, dtype=np.uint8)
-        image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
-        return image
+        return base64.b64decode(image_string)
     except Exception as e:
         logger.error(f"Error decoding image: {e}")
         return None
 
-def annotate_frame(image, result):
-    """Draw bounding boxes on image"""
-    annotated_frame = image.copy()
+def decode_base64_image(image_string):
+    """Decode base64 image string to numpy array"""
+    image_data = decode_base64_data(image_string)
+    if image_data is None:
+        return None
+    return decode_image_bytes(image_data)
+
+def read_image_request():
+    """
+    Read the image and options of a detect-image request
+    Accepts JSON with a base64 data URL, multipart/form-data with an 'image' file, or a raw
+    application/octet-stream / image/jpeg body (options in the query string)
+    Returns (image_data, options), image_data holds the encoded image bytes (None when missing,
+    b'' for an invalid base64 payload so it is reported as a decode failure)
+    """
+    if request.is_json:
+        options = dict(request.json)
+        image_base64 = options.pop('image', None)
+        image_data = (decode_base64_data(image_base64) or b'') if image_base64 else None
+    elif request.mimetype == 'multipart/form-data':
+        options = request.form.to_dict()
+        image_file = request.files.get('image')
+        image_data = image_file.read() if image_file else None
+    else:
+        options = request.args.to_dict()
+        image_data = request.get_data() or None
+    
+    # Query string options apply to every content type
+    for key, value in request.args.items():
+        options.setdefault(key, value)
     
+    return image_data, options
+
+def extract_boxes(result):
+    """Normalized xyxy boxes, class ids and confidences of a result (for client-side drawing)"""
     boxes = result.boxes
-    for box in boxes:
-        x1, y1, x2, y2 = map(int, box.xyxy[0])
-        cls_id = int(box.cls[0].item())
-        conf = box.conf[0].item()
-        
-        color = CLASS_COLORS.get(cls_id, (255, 255, 255))
-        
-        # Draw bounding box
-        cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), color, 2)
-        
-        # Draw label
-        label = f"{CLASS_NAMES.get(cls_id, 'unknown')} {conf:.2%}"
-        text_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)[0]
-        cv2.rectangle(annotated_frame, (x1, y1 - 25), (x1 + text_size[0], y1), color, -1)
-        cv2.putText(annotated_frame, label, (x1, y1 - 5), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+    xyxyn = boxes.xyxyn.cpu().numpy()
+    cls_ids = boxes.cls.cpu().numpy().astype(int)
+    confs = boxes.conf.cpu().numpy()
     
-    return annotated_frame
+    return [
+        {
+            'class_id': int(cls_id),
+            'class': CLASS_NAMES.get(int(cls_id), 'unknown'),
+            'confidence': round(float(conf), 4),
+            'box': [round(float(v), 5) for v in box],
+        }
+        for box, cls_id, conf in zip(xyxyn, cls_ids, confs)
+    ]
+
+def wants_boxes_only(options):
+    """Client only needs boxes/counts, skip server-side annotation and JPEG encoding"""
+    if str(options.get('mode', '')).lower() == 'boxes':
+        return True
+    return str(options.get('return_image', 'true')).lower() in ('false', '0', 'no')
 
-def draw_detections(image, results):
-    """Draw bounding boxes on image"""
-    annotated_frame = image.copy()
+def wants_jpeg_response(options):
+    """Client asked for the annotated image as raw image/jpeg instead of base64 JSON"""
+    if 'response_format' in options:
+        return str(options['response_format']).lower() == 'jpeg'
+    return request.accept_mimetypes.best == 'image/jpeg'
+
+def detection_region(options):
+    """
+    DetectionRegion of a request / camera session: the settings of options['camera_id'] from
+    CAMERA_CONFIG, overridden by roi / tiled / tile_size / tile_overlap / full_frame options.
+    None when inference runs on the whole frame in one pass
+    """
+    config = {}
+    camera_id = options.get('camera_id')
+    if camera_id:
+        if camera_id not in CAMERA_CONFIGS:
+            raise RegionConfigError(f"Unknown camera_id '{camera_id}'")
+        config.update(CAMERA_CONFIGS[camera_id])
+    config.update({key: options[key] for key in REGION_OPTIONS if key in options})
     
-    for result in results:
-        annotated_frame = annotate_frame(annotated_frame, result)
+    region = DetectionRegion.from_config(config)
+    return region if region.active else None
+
+def video_motion_gate(options):
+    """
+    MotionGate of a video request: the MOTION_* defaults overridden by the motion_* options,
+    None when gating is off
+    """
+    config = {
+        'motion_gate': MOTION_GATE,
+        'motion_threshold': MOTION_THRESHOLD,
+        'motion_pixel_threshold': MOTION_PIXEL_THRESHOLD,
+        'motion_max_skip': MOTION_MAX_SKIP,
+        'motion_width': MOTION_GATE_WIDTH,
+    }
+    config.update({key: options[key] for key in MOTION_OPTIONS if key in options})
+    return MotionGate.from_config(config)
+
+def predict_frames(images, confidence_threshold, region=None):
+    """model.predict on whole frames, or on the ROI crops / tiles of region (TILE_BATCH_SIZE per pass)"""
+    def predict(batch):
+        with inference_lock:
+            return model.predict(batch, conf=confidence_threshold, verbose=False)
     
-    return annotated_frame
+    if region is None:
+        return predict(images)
+    return region.predict(predict, images, TILE_BATCH_SIZE)
 
 def convert_to_web_compatible_mp4(input_path, output_path):
     """
@@ -191,253 +548,2012 @@ def convert_to_web_compatible_mp4(input_path, output_path):
         logger.error(f"FFmpeg conversion failed: {e}")
         return False
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Health check endpoint"""
-    MODEL_PATH = Path("results/helmet_balanced/weights/best.pt")
-    return jsonify({
-        'status': 'ok',
-        'model_loaded': model is not None,
-        'ffmpeg_available': FFMPEG_AVAILABLE,
-        'model_path': str(MODEL_PATH)
-    })
+class FFmpegPipeError(RuntimeError):
+    """Raised when the FFmpeg encoder pipe cannot be started or breaks"""
 
-@app.route('/api/detect-image', methods=['POST'])
-def detect_image():
-    """Detect helmet in image"""
-    if model is None:
-        return jsonify({'error': 'Model not loaded'}), 500
+class FFmpegPipeWriter:
+    """
+    Drop-in replacement for cv2.VideoWriter that streams raw BGR frames into FFmpeg stdin
+    Produces the browser-compatible H.264 MP4 in a single pass (no XVID temp file + re-encode)
+    """
     
-    try:
-        data = request.json
-        image_base64 = data.get('image')
-        confidence_threshold = float(data.get('confidence_threshold', 0.5))
+    def __init__(self, output_path, fps, frame_size):
+        width, height = frame_size
+        # -f rawvideo -pix_fmt bgr24: frame OpenCV mentah dari stdin
+        # scale: yuv420p butuh width/height genap
+        cmd = [
+            'ffmpeg',
+            '-loglevel', 'error',
+            '-f', 'rawvideo',
+            '-pix_fmt', 'bgr24',
+            '-s', f'{width}x{height}',
+            '-r', str(fps or 30),
+            '-i', '-',
+            '-an',
+            '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2',
+            '-c:v', 'libx264',
+            '-preset', 'fast',
+            '-crf', '23',
+            '-pix_fmt', 'yuv420p',
+            '-movflags', '+faststart',
+            '-y',
+            str(output_path)
+        ]
+        try:
+            self.process = subprocess.Popen(
+                cmd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE
+            )
+        except OSError as e:
+            raise FFmpegPipeError(f"Failed to start FFmpeg: {e}")
+        self.returncode = None
+    
+    def write(self, frame):
+        try:
+            self.process.stdin.write(np.ascontiguousarray(frame).data)
+        except (BrokenPipeError, ValueError):
+            self.release()
+            raise FFmpegPipeError(f"FFmpeg pipe closed: {self.stderr}")
+    
+    def release(self):
+        """Close stdin and wait for FFmpeg to finish, returns True if encoding succeeded"""
+        if self.returncode is None:
+            try:
+                self.process.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+            self.stderr = self.process.stderr.read().decode('utf-8', errors='replace')
+            self.returncode = self.process.wait()
+            if self.returncode != 0:
+                logger.error(f"FFmpeg error: {self.stderr}")
+        return self.returncode == 0
+
+class VideoDecodeError(ValueError):
+    """Raised when an uploaded video cannot be decoded"""
+
+def mp4_moov_first(head):
+    """True if the moov box (index) comes before mdat, i.e. the MP4 can be decoded from a pipe"""
+    offset = 0
+    while offset + 8 <= len(head):
+        size = int.from_bytes(head[offset:offset + 4], 'big')
+        box = head[offset + 4:offset + 8]
+        if box == b'moov':
+            return True
+        if box == b'mdat':
+            return False
+        if size == 1 and offset + 16 <= len(head):
+            size = int.from_bytes(head[offset + 8:offset + 16], 'big')
+        if size < 8:
+            return False
+        offset += size
+    # Index not within the sniffed bytes, play safe
+    return False
+
+def sniff_video_container(head):
+    """
+    Identify the container from the first bytes of an upload
+    Returns (container, streamable) with container None for anything that is not a video;
+    streamable means FFmpeg can decode it sequentially from a pipe while it is still arriving
+    """
+    if head[4:8] == b'ftyp':
+        return 'mp4', mp4_moov_first(head)
+    if head[:4] == b'\x1a\x45\xdf\xa3':
+        return 'matroska', True
+    if head[:4] == b'RIFF' and head[8:12] == b'AVI ':
+        return 'avi', True
+    if head[:1] == b'\x47' and head[188:189] == b'\x47':
+        return 'mpegts', True
+    if head[:4] == b'\x00\x00\x01\xba':
+        return 'mpeg', True
+    if head[:3] == b'FLV':
+        return 'flv', True
+    if head[:8] == b'\x30\x26\xb2\x75\x8e\x66\xcf\x11':
+        return 'asf', True
+    return None, False
+
+class VideoUpload:
+    """
+    Video upload written to a temp file while it is being processed
+    The request thread appends chunks; readers follow the growing file until it is complete.
+    The processing side cancels the upload when the video turns out to be unreadable,
+    which tells the request thread to stop reading the body
+    """
+    
+    def __init__(self):
+        self.file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4')
+        self.path = self.file.name
+        self.head = bytearray()
+        self.container = None
+        self.streamable = False
+        self.bytes_received = 0
+        self.sha256 = hashlib.sha256()
+        self.file_hash = None
+        self.complete = False
+        self.error = None
+        self.cancelled = None
+        self.condition = threading.Condition()
+    
+    def append(self, chunk):
+        if len(self.head) < UPLOAD_SNIFF_BYTES:
+            self.head += chunk[:UPLOAD_SNIFF_BYTES - len(self.head)]
+        self.file.write(chunk)
+        self.file.flush()
+        self.sha256.update(chunk)
+        with self.condition:
+            self.bytes_received += len(chunk)
+            self.condition.notify_all()
+    
+    def sniff(self):
+        """Identify the container from the bytes received so far, returns False for non-video data"""
+        self.container, self.streamable = sniff_video_container(bytes(self.head))
+        return self.container is not None
+    
+    def finish(self, error=None):
+        """Mark the upload as fully received (or broken off with error)"""
+        self.file.close()
+        with self.condition:
+            if error is None:
+                self.file_hash = self.sha256.hexdigest()
+            self.error = error
+            self.complete = True
+            self.condition.notify_all()
+    
+    def cancel(self, reason):
+        """Stop the upload from the processing side"""
+        with self.condition:
+            self.cancelled = reason
+            self.condition.notify_all()
+    
+    def discard(self):
+        """Close and delete the temp file of an upload that was never handed to processing"""
+        self.file.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+    
+    def wait_complete(self):
+        """Block until the whole upload is on disk, raises if it was broken off"""
+        with self.condition:
+            while not self.complete and self.cancelled is None:
+                self.condition.wait(1.0)
+        if self.error is not None:
+            raise ConnectionError(f"Video upload failed: {self.error}")
+        if not self.complete:
+            raise ConnectionError(f"Video upload cancelled: {self.cancelled}")
+    
+    def follow(self, chunk_size=UPLOAD_CHUNK_SIZE):
+        """Yield the upload bytes as they arrive, ends when the upload is complete or cancelled"""
+        offset = 0
+        with open(self.path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if chunk:
+                    offset += len(chunk)
+                    yield chunk
+                    continue
+                with self.condition:
+                    while (self.bytes_received <= offset and not self.complete
+                           and self.cancelled is None):
+                        self.condition.wait(1.0)
+                    if self.bytes_received <= offset:
+                        return
+
+class FFmpegPipeReader:
+    """
+    Drop-in replacement for cv2.VideoCapture that decodes through FFmpeg
+    source is a VideoUpload, whose bytes are fed to FFmpeg stdin as they arrive so detection starts
+    while the rest of the video is still being uploaded (the frame count is unknown up front,
+    CAP_PROP_FRAME_COUNT is 0), or the path of a complete video file. Frames wider than max_width
+    are scaled down by FFmpeg while decoding, hwaccel selects FFmpeg hardware decoding
+    """
+    
+    def __init__(self, source, timeout=STREAM_DECODE_TIMEOUT, max_width=0, hwaccel=''):
+        self.upload = source if isinstance(source, VideoUpload) else None
+        self.hwaccel = hwaccel or None
+        self.width, self.height, self.fps = 0, 0, 0.0
+        self.frame_count = 0
+        self.stderr_tail = deque(maxlen=20)
+        self.header_ready = threading.Event()
+        self.returncode = None
         
-        if not image_base64:
-            return jsonify({'error': 'No image provided'}), 400
+        cmd = ['ffmpeg', '-hide_banner', '-nostats']
+        if hwaccel:
+            cmd += ['-hwaccel', hwaccel]
+        cmd += ['-i', 'pipe:0' if self.upload is not None else str(source), '-an']
+        if max_width > 0:
+            # Only ever downscale, -2 keeps the height even for the encoder; fast_bilinear costs a
+            # fraction of the default bicubic and is plenty for a 640px model input
+            cmd += ['-vf', f"scale='min({max_width},iw)':-2:flags=fast_bilinear"]
+        cmd += ['-f', 'rawvideo', '-pix_fmt', 'bgr24', 'pipe:1']
         
-        # Decode image
-        image = decode_base64_image(image_base64)
-        if image is None:
-            return jsonify({'error': 'Failed to decode image'}), 400
+        if self.upload is None:
+            probe = cv2.VideoCapture(str(source))
+            self.frame_count = int(probe.get(cv2.CAP_PROP_FRAME_COUNT))
+            probe.release()
+        try:
+            self.process = subprocess.Popen(
+                cmd,
+                stdin=subprocess.PIPE if self.upload is not None else subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
+        except OSError as e:
+            raise FFmpegPipeError(f"Failed to start FFmpeg: {e}")
+        if self.upload is not None:
+            threading.Thread(target=self._feed, name='ffmpeg-feed', daemon=True).start()
+        threading.Thread(target=self._read_stderr, name='ffmpeg-stderr', daemon=True).start()
+        
+        # FFmpeg prints the output stream (size after autorotation, fps) once the first frame is decoded
+        self.header_ready.wait(timeout)
+        if not self.width:
+            self.release()
+            raise VideoDecodeError(f"Unreadable video: {self.error_message()}")
+        self.frame_bytes = self.width * self.height * 3
+        # grab() target, reused so skipped frames cost no allocation
+        self.scratch = bytearray(self.frame_bytes)
+        self.opened = True
+    
+    def _feed(self):
+        try:
+            for chunk in self.upload.follow():
+                self.process.stdin.write(chunk)
+        except (BrokenPipeError, OSError, ValueError):
+            pass
+        finally:
+            try:
+                self.process.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+    
+    def _read_stderr(self):
+        in_output = False
+        for raw_line in iter(self.process.stderr.readline, b''):
+            line = raw_line.decode('utf-8', errors='replace').strip()
+            self.stderr_tail.append(line)
+            if line.startswith('Output #0'):
+                in_output = True
+            elif in_output and not self.header_ready.is_set() and 'Video:' in line:
+                size = re.search(r', (\d{2,5})x(\d{2,5})', line)
+                fps = re.search(r'([\d.]+) (?:fps|tbr)', line)
+                if size:
+                    self.width, self.height = int(size.group(1)), int(size.group(2))
+                    self.fps = float(fps.group(1)) if fps else 30.0
+                self.header_ready.set()
+        self.header_ready.set()
+    
+    def error_message(self):
+        return next((line for line in reversed(self.stderr_tail) if line), 'no video stream found')
+    
+    def isOpened(self):
+        return self.opened
+    
+    def _read_into(self, buffer):
+        view = memoryview(buffer)
+        filled = 0
+        while filled < self.frame_bytes:
+            count = self.process.stdout.readinto(view[filled:])
+            if not count:
+                self.opened = False
+                self.returncode = self.process.wait()
+                return False
+            filled += count
+        return True
+    
+    def read(self):
+        # bytearray keeps the frame writable for in-place annotation
+        buffer = bytearray(self.frame_bytes)
+        if not self._read_into(buffer):
+            return False, None
+        return True, np.frombuffer(buffer, dtype=np.uint8).reshape(self.height, self.width, 3)
+    
+    def grab(self):
+        """Skip one frame (FFmpeg still decodes it, but nothing is allocated or converted)"""
+        return self._read_into(self.scratch)
+    
+    def get(self, prop):
+        return {
+            cv2.CAP_PROP_FPS: self.fps,
+            cv2.CAP_PROP_FRAME_WIDTH: self.width,
+            cv2.CAP_PROP_FRAME_HEIGHT: self.height,
+            cv2.CAP_PROP_FRAME_COUNT: self.frame_count,
+        }.get(prop, 0)
+    
+    def failed(self):
+        """True if FFmpeg exited with an error after the last frame"""
+        return self.returncode not in (None, 0)
+    
+    def release(self):
+        self.opened = False
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        self.process.stdout.close()
+
+def open_video_capture(path, decode_width=0, hwaccel=VIDEO_HWACCEL):
+    """
+    Frame source for a complete video file: an FFmpegPipeReader when frames should be scaled down
+    to decode_width or decoded with hwaccel, cv2.VideoCapture otherwise (or without FFmpeg)
+    """
+    if (decode_width > 0 or hwaccel) and ffmpeg_available():
+        try:
+            return FFmpegPipeReader(path, max_width=decode_width, hwaccel=hwaccel)
+        except FFmpegPipeError as e:
+            logger.warning(f"FFmpeg decoding unavailable, using OpenCV at full resolution: {e}")
+    return cv2.VideoCapture(str(path))
+
+def skip_to_frame(cap, position, target, seek_gap=0):
+    """
+    Move cap from frame position (the one the next read() returns) to frame target: a container
+    seek when the gap is longer than seek_gap (> 0) and cap is a seekable cv2.VideoCapture, grab()
+    otherwise, so skipped frames are never converted to BGR. Returns (seeked, grabbed_frames)
+    """
+    gap = target - position
+    if 0 < seek_gap < gap and isinstance(cap, cv2.VideoCapture):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+        return True, 0
+    for grabbed in range(max(gap, 0)):
+        if not cap.grab():
+            return False, grabbed
+    return False, max(gap, 0)
+
+def count_detections(classes, confs, total_detections, details, frame_index=None):
+    """Add one frame's detections (class id / confidence arrays from result_arrays) to the running totals"""
+    counts = np.bincount(classes, minlength=3)
+    total_detections['with_helmet'] += int(counts[0])
+    total_detections['no_helmet'] += int(counts[1])
+    total_detections['motorcycle'] += int(counts[2])
+    
+    for cls_id, conf in zip(classes.tolist(), confs.tolist()):
+        detail = {
+            'class': CLASS_NAMES.get(cls_id, 'unknown'),
+            'confidence': f"{conf:.2%}"
+        }
+        if frame_index is not None:
+            detail['frame'] = frame_index
+        details.append(detail)
+
+def auto_video_batch_size(width, height, sample_rate):
+    """
+    Pick video batch size based on available RAM
+    Each batched sample keeps sample_rate raw frames buffered plus the annotated copy
+    and the letterboxed float32 model input
+    """
+    if psutil is None:
+        return 4
+    
+    frame_bytes = width * height * 3
+    bytes_per_sample = frame_bytes * (sample_rate + 1) + 640 * 640 * 3 * 4
+    budget = psutil.virtual_memory().available * VIDEO_BATCH_RAM_FRACTION
+    return max(1, min(MAX_VIDEO_BATCH_SIZE, int(budget // max(bytes_per_sample, 1))))
+
+def put_until_stopped(q, item, stop_event):
+    """Put item on a bounded queue, blocking (back-pressure) until there is room or the pipeline stops"""
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def get_until_stopped(q, stop_event):
+    """Get item from a queue, returns _PIPELINE_DONE if the pipeline stops"""
+    while not stop_event.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _PIPELINE_DONE
+
+def run_video_detection(input_path, output_path, confidence_threshold=0.5, sample_rate=5, batch_size=0,
+                        ffmpeg_pipe=False, progress_callback=None, capture=None, region=None, decode_width=0,
+                        motion_gate=None, sampler=None):
+    """
+    Run helmet detection on a video file and write the annotated video
+    (web-compatible MP4 through an FFmpeg pipe when ffmpeg_pipe is set, XVID otherwise)
+    capture replaces open_video_capture(input_path, decode_width), e.g. an FFmpegPipeReader on an
+    upload in progress; with decode_width the frames, and so the output video, are scaled down
+    region (DetectionRegion) restricts detection to ROI polygons and/or runs tiled inference
+    motion_gate (MotionGate) skips inference on sampled frames without motion, they reuse the
+    detections of the previous sample
+    sampler (SampleRateController) replaces the fixed sample_rate with a stride re-planned from the
+    measured latencies to hold a target FPS / deadline, its decisions are returned as adaptive_sampling
+    progress_callback(written_frames, total_frames) is called after every written frame
+    Decode, inference and annotate/encode run as separate threads connected by bounded
+    queues, so OpenCV decoding/encoding overlaps with model inference. Sampled frames are
+    collected into batches and predicted in one forward pass; frame order is preserved.
+    Detections are linked into tracks and the frames between two samples are held back until
+    the next sample is inferred, then drawn with boxes interpolated along the tracks. Each track
+    is counted once (majority-vote class), per-frame detection sums are kept as total_detections
+    """
+    cap = capture if capture is not None else open_video_capture(input_path, decode_width)
+    out = None
+    if motion_gate is not None:
+        motion_gate.reset()
+    
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        
+        if sampler is not None:
+            sampler.start(fps, total_frames)
+        # Buffered frames per sample and frames a track may go unmatched scale with the (largest) stride
+        track_rate = sampler.max_rate if sampler is not None else sample_rate
+        if batch_size <= 0:
+            batch_size = auto_video_batch_size(width, height, track_rate)
         
-        # Run detection
-        results = model.predict(image, conf=confidence_threshold, verbose=False)
+        if progress_callback is not None:
+            progress_callback(0, total_frames)
         
-        # Annotate image with detections
-        annotated_image = image.copy()
+        if ffmpeg_pipe:
+            out = FFmpegPipeWriter(output_path, fps, (width, height))
+        else:
+            # Use XVID codec untuk temporary file (reliable)
+            fourcc = cv2.VideoWriter_fourcc(*'XVID')
+            out = cv2.VideoWriter(str(output_path), fourcc, fps, (width, height))
         
-        # Process detections
-        detections = {
-            'with_helmet': 0,
-            'no_helmet': 0,
-            'motorcycle': 0,
+        state = {
+            'total_detections': {
+                'with_helmet': 0,
+                'no_helmet': 0,
+                'motorcycle': 0,
+            },
             'details': [],
-            'processed_image': None
+            'detected_frames': 0,
+            'preview_frame': None,
+            'done_frames': 0,
         }
+        counter = UniqueObjectCounter(CLASS_NAMES, fps, max_age=track_rate * TRACK_MAX_MISSED_SAMPLES)
+        # Accumulated seconds spent inside each stage
+        stage_time = {'decode': 0.0, 'motion': 0.0, 'inference': 0.0, 'annotate': 0.0, 'track': 0.0, 'encode': 0.0}
+        stage_count = {'decode': 0, 'motion': 0, 'inference': 0, 'annotate': 0, 'track': 0, 'encode': 0}
+        
+        def record_stage(name, elapsed, items=1):
+            stage_time[name] += elapsed
+            stage_count[name] += items
+            observe_stage('video', name, elapsed, items)
+            
+        decoded_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        inferred_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        stop_event = threading.Event()
+        errors = []
+        
+        def decode_stage():
+            try:
+                frame_count = 0
+                next_sample = 1
+                while cap.isOpened():
+                    # Run detection every sample_rate frames (the sampler's current stride when adaptive)
+                    if sampler is None:
+                        is_sampled = (frame_count + 1) % sample_rate == 0 or frame_count == 0
+                    else:
+                        is_sampled = frame_count + 1 >= next_sample
+                        if is_sampled:
+                            next_sample = frame_count + 1 + sampler.sample_rate
+                    start = time.perf_counter()
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    record_stage('decode', time.perf_counter() - start)
+                    
+                    # Static sample: the inference stage passes on the previous sample's result
+                    reuse = False
+                    if is_sampled and motion_gate is not None:
+                        start = time.perf_counter()
+                        reuse = not motion_gate.check(frame)
+                        record_stage('motion', time.perf_counter() - start)
+                    
+                    frame_count += 1
+                    if not put_until_stopped(decoded_queue, (frame_count, frame, is_sampled, reuse), stop_event):
+                        return
+                put_until_stopped(decoded_queue, _PIPELINE_DONE, stop_event)
+            except Exception as e:
+                errors.append(e)
+                stop_event.set()
+        
+        def inference_stage():
+            try:
+                # Buffered (frame_index, frame, is_sampled, reuse) waiting for the next batch
+                pending = []
+                pending_samples = 0
+                last_result = None
+                
+                def flush_batch():
+                    nonlocal last_result
+                    sampled = [frame for _, frame, is_sampled, reuse in pending if is_sampled and not reuse]
+                    results = iter([])
+                    if sampled:
+                        start = time.perf_counter()
+                        results = iter(predict_frames(sampled, confidence_threshold, region))
+                        elapsed = time.perf_counter() - start
+                        record_stage('inference', elapsed, len(sampled))
+                        if sampler is not None:
+                            sampler.observe_inference(elapsed, len(sampled))
+                    if sampler is not None:
+                        # Counted here rather than at decode time, which runs ahead by the queue sizes
+                        sampler.observe_sample(sum(1 for item in pending if item[2]))
+                    
+                    for index, frame, is_sampled, reuse in pending:
+                        if is_sampled and not reuse:
+                            last_result = next(results)
+                        result = last_result if is_sampled else None
+                        if not put_until_stopped(inferred_queue, (index, frame, result), stop_event):
+                            return False
+                    pending.clear()
+                    return True
+                
+                while True:
+                    item = get_until_stopped(decoded_queue, stop_event)
+                    if item is _PIPELINE_DONE:
+                        break
+                    pending.append(item)
+                    if item[2] and not item[3]:
+                        pending_samples += 1
+                    # A reused sample needs the result before it, flushing also keeps static
+                    # stretches from piling up frames while the batch waits for moving samples.
+                    # The adaptive sampler gets its latencies at least every PIPELINE_QUEUE_SIZE frames
+                    if (pending_samples >= batch_size or item[3]
+                            or (sampler is not None and pending_samples and len(pending) >= PIPELINE_QUEUE_SIZE)):
+                        if not flush_batch():
+                            return
+                        pending_samples = 0
+                
+                if pending and not stop_event.is_set():
+                    flush_batch()
+                put_until_stopped(inferred_queue, _PIPELINE_DONE, stop_event)
+            except Exception as e:
+                errors.append(e)
+                stop_event.set()
         
-        for result in results:
-            boxes = result.boxes
-            annotated_image = annotate_frame(annotated_image, result)
+        def encode_stage():
+            tracker = BoxTracker(TRACK_IOU_THRESHOLD, max_age=track_rate * TRACK_MAX_MISSED_SAMPLES)
+            # Skipped frames since the last sampled frame, waiting for the next sample's tracks
+            held_frames = []
+            previous = None
             
-            for box in boxes:
-                cls_id = int(box.cls[0].item())
-                conf = box.conf[0].item()
+            def write_frame(frame):
+                start = time.perf_counter()
+                out.write(frame)
+                record_stage('encode', time.perf_counter() - start)
+                state['done_frames'] += 1
+                if sampler is not None:
+                    sampler.update(state['done_frames'])
                 
-                if cls_id == 0:
-                    detections['with_helmet'] += 1
-                elif cls_id == 1:
-                    detections['no_helmet'] += 1
-                elif cls_id == 2:
-                    detections['motorcycle'] += 1
+                if progress_callback is not None:
+                    progress_callback(state['done_frames'], total_frames)
+            
+            def write_held_frames(current):
+                for held_index, held_frame in held_frames:
+                    start = time.perf_counter()
+                    boxes, confs, classes, track_ids = interpolate_tracks(previous, current, held_index)
+                    draw_boxes(held_frame, BOX_STYLE, boxes, classes, confs, track_ids)
+                    record_stage('track', time.perf_counter() - start)
+                    write_frame(held_frame)
+                held_frames.clear()
+            
+            try:
+                while True:
+                    item = get_until_stopped(inferred_queue, stop_event)
+                    if item is _PIPELINE_DONE:
+                        break
+                    index, frame, result = item
+                    
+                    if result is None:
+                        if previous is None:
+                            write_frame(frame)
+                        else:
+                            held_frames.append((index, frame))
+                        continue
+                    
+                    start = time.perf_counter()
+                    boxes, classes, confs, _ = result_arrays(result)
+                    current = (index, tracker.update(index, boxes, confs, classes))
+                    record_stage('track', time.perf_counter() - start)
+                    write_held_frames(current)
+                    previous = current
+                    
+                    start = time.perf_counter()
+                    track_ids = np.array(list(current[1].keys()), dtype=np.int64)
+                    annotated_frame = draw_boxes(frame, BOX_STYLE, boxes, classes, confs, track_ids)
+                    count_detections(classes, confs, state['total_detections'], state['details'], index)
+                    counter.observe(index, track_ids, classes, confs)
+                    record_stage('annotate', time.perf_counter() - start)
+                    
+                    state['detected_frames'] += 1
+                    if state['preview_frame'] is None:
+                        state['preview_frame'] = annotated_frame
+                    write_frame(annotated_frame)
                 
-                detections['details'].append({
-                    'class': CLASS_NAMES.get(cls_id, 'unknown'),
-                    'confidence': f"{conf:.2%}"
-                })
+                if previous is not None and not stop_event.is_set():
+                    # Frames after the last sample follow the tracks' velocity
+                    write_held_frames(None)
+            except Exception as e:
+                errors.append(e)
+                stop_event.set()
         
-        # Convert annotated image to base64
-        _, buffer = cv2.imencode('.jpg', annotated_image)
-        processed_image_base64 = base64.b64encode(buffer).decode('utf-8')
-        detections['processed_image'] = f"data:image/jpeg;base64,{processed_image_base64}"
+        logger.info(f"Processing {total_frames} frames (batch size {batch_size})...")
         
-        return jsonify(detections)
-    
-    except Exception as e:
-        logger.error(f"Error in detect_image: {e}")
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/detect-video', methods=['POST'])
-def detect_video():
-    """Detect helmet in video"""
-    if model is None:
-        return jsonify({'error': 'Model not loaded'}), 500
-    
-    temp_input = None
-    temp_output_raw = None
-    cap = None
-    out = None
-    
-    try:
-        video_file = request.files.get('video')
-        confidence_threshold = float(request.form.get('confidence_threshold', 0.5))
-        sample_rate = int(request.form.get('sample_rate', 5))
+        pipeline_start = time.perf_counter()
+        stages = [
+            threading.Thread(target=decode_stage, name='video-decode', daemon=True),
+            threading.Thread(target=inference_stage, name='video-inference', daemon=True),
+            threading.Thread(target=encode_stage, name='video-encode', daemon=True),
+        ]
+        for stage in stages:
+            stage.start()
+        for stage in stages:
+            stage.join()
+        wall_time = time.perf_counter() - pipeline_start
         
-        if not video_file:
-            return jsonify({'error': 'No video provided'}), 400
+        if errors:
+            raise errors[0]
+        if capture is None and isinstance(cap, FFmpegPipeReader) and cap.failed():
+            raise VideoDecodeError(f"Video decoding failed: {cap.error_message()}")
         
-        # Save temp input video
-        temp_input = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4')
-        video_file.save(temp_input.name)
-        temp_input.close()
+        if ffmpeg_pipe:
+            start = time.perf_counter()
+            if not out.release():
+                raise FFmpegPipeError(f"FFmpeg encoding failed: {out.stderr}")
+            observe_ffmpeg('pipe', stage_time['encode'] + time.perf_counter() - start)
         
-        # Process video
-        cap = cv2.VideoCapture(temp_input.name)
+        observe_video_run(state['done_frames'], wall_time)
         
-        frame_count = 0
-        detected_frames = 0
-        total_detections = {
-            'with_helmet': 0,
-            'no_helmet': 0,
-            'motorcycle': 0,
+        stage_latency = {
+            f"{name}_ms": round(stage_time[name] / stage_count[name] * 1000, 2) if stage_count[name] else 0.0
+            for name in stage_time
         }
-        details = []
+        stage_latency['total_s'] = round(wall_time, 3)
+        unique_counts, tracks = counter.finish()
         
-        fps = cap.get(cv2.CAP_PROP_FPS)
+        return {
+            'total_detections': state['total_detections'],
+            'unique_counts': unique_counts,
+            'tracks': tracks,
+            'details': state['details'],
+            'preview_frame': state['preview_frame'],
+            # Streamed decoding does not know the frame count up front
+            'total_frames': total_frames or stage_count['decode'],
+            'processed_frames': stage_count['inference'],
+            'batch_size': batch_size,
+            'stage_latency': stage_latency,
+            'motion_gate': motion_gate.stats() if motion_gate is not None else None,
+            'adaptive_sampling': sampler.stats(state['done_frames']) if sampler is not None else None,
+            'decode': {
+                'decoder': 'ffmpeg' if isinstance(cap, FFmpegPipeReader) else 'opencv',
+                'width': width,
+                'height': height,
+                'hwaccel': cap.hwaccel if isinstance(cap, FFmpegPipeReader) else None,
+            },
+        }
+    finally:
+        cap.release()
+        if out is not None:
+            out.release()
+
+def run_video_analytics(input_path, confidence_threshold=0.5, samples_per_second=2.0, batch_size=0,
+                        progress_callback=None, region=None, motion_gate=None, decode_width=0):
+    """
+    Counts, tracks and per-sample detections of a video file without writing an annotated video
+    Frames at samples_per_second timestamps are reached with skip_to_frame (a container seek when
+    the gap is longer than ANALYTICS_SEEK_GAP_S, grab() otherwise; FFmpeg-scaled captures with
+    decode_width only grab); decoding runs on its own thread while the samples are predicted in
+    batches. Samples are linked into tracks like the annotated mode, so the counts are unique
+    objects. With motion_gate, samples without motion reuse the previous detections.
+    progress_callback(done_samples, total_samples)
+    """
+    if samples_per_second <= 0:
+        raise ValueError('samples_per_second must be positive')
+    cap = open_video_capture(input_path, decode_width)
+    if motion_gate is not None:
+        motion_gate.reset()
+    
+    try:
+        if not cap.isOpened():
+            raise VideoDecodeError("Video decoding failed: cannot open the file")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
         width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        # 0 for containers without an index (e.g. MediaRecorder WebM): sampling then runs to the end
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
         
-        # Create temporary output video (raw, before FFmpeg conversion)
-        temp_output_raw = tempfile.NamedTemporaryFile(delete=False, suffix='_raw.avi')
-        temp_output_raw.close()
+        # Sample n is 0-based frame int(n * step), step >= 1 so no frame is sampled twice
+        step = max(fps / samples_per_second, 1.0)
+        total_samples = int((total_frames - 1) / step) + 1 if total_frames > 0 else 0
+        seek_gap = max(int(ANALYTICS_SEEK_GAP_S * fps), 1)
+        if batch_size <= 0:
+            batch_size = auto_video_batch_size(width, height, 1)
         
-        # Use XVID codec untuk temporary file (reliable)
-        fourcc = cv2.VideoWriter_fourcc(*'XVID')
-        out = cv2.VideoWriter(temp_output_raw.name, fourcc, fps, (width, height))
+        if progress_callback is not None:
+            progress_callback(0, total_samples)
         
-        last_frame = None
-        preview_frame = None
+        decoded_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        stop_event = threading.Event()
+        errors = []
+        decode_stats = {'seconds': 0.0, 'seeks': 0, 'grabbed_frames': 0, 'frames': 0, 'motion_seconds': 0.0}
         
-        logger.info(f"Processing {total_frames} frames...")
+        def decode_samples():
+            try:
+                # Index of the frame the next read() returns
+                position = 0
+                for index in itertools.count():
+                    target = int(index * step)
+                    if 0 < total_frames <= target:
+                        break
+                    start = time.perf_counter()
+                    seeked, grabbed = skip_to_frame(cap, position, target, seek_gap)
+                    decode_stats['seeks'] += seeked
+                    decode_stats['grabbed_frames'] += grabbed
+                    ret, frame = cap.read()
+                    elapsed = time.perf_counter() - start
+                    if not ret:
+                        break
+                    decode_stats['seconds'] += elapsed
+                    observe_stage('video', 'decode', elapsed)
+                    position = decode_stats['frames'] = target + 1
+                    
+                    reuse = False
+                    if motion_gate is not None:
+                        start = time.perf_counter()
+                        reuse = not motion_gate.check(frame)
+                        elapsed = time.perf_counter() - start
+                        decode_stats['motion_seconds'] += elapsed
+                        observe_stage('video', 'motion', elapsed)
+                    if not put_until_stopped(decoded_queue, (target, frame, reuse), stop_event):
+                        return
+                put_until_stopped(decoded_queue, _PIPELINE_DONE, stop_event)
+            except Exception as e:
+                errors.append(e)
+                stop_event.set()
         
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            frame_count += 1
+        max_age = int(step * TRACK_MAX_MISSED_SAMPLES) + 1
+        tracker = BoxTracker(TRACK_IOU_THRESHOLD, max_age=max_age)
+        counter = UniqueObjectCounter(CLASS_NAMES, fps, max_age=max_age)
+        total_detections = {'with_helmet': 0, 'no_helmet': 0, 'motorcycle': 0}
+        samples = []
+        inference_seconds = 0.0
+        inferred_samples = 0
+        last_result = None
+        
+        def predict_batch(batch):
+            nonlocal inference_seconds, inferred_samples, last_result
+            frames = [frame for _, frame, reuse in batch if not reuse]
+            results = iter([])
+            if frames:
+                start = time.perf_counter()
+                results = iter(predict_frames(frames, confidence_threshold, region))
+                elapsed = time.perf_counter() - start
+                inference_seconds += elapsed
+                inferred_samples += len(frames)
+                observe_stage('video', 'inference', elapsed, len(frames))
             
-            # Run detection every sample_rate frames
-            if frame_count % sample_rate == 0 or frame_count == 1:
-                results = model.predict(frame, conf=confidence_threshold, verbose=False)
-                annotated_frame = draw_detections(frame, results)
+            for index, _, reuse in batch:
+                if not reuse:
+                    last_result = next(results)
+                result = last_result
+                boxes, classes, confs, _ = result_arrays(result)
+                # Frame numbers count from 1 like the annotated mode
+                observed = tracker.update(index + 1, boxes, confs, classes)
+                track_ids = list(observed)
+                counter.observe(index + 1, track_ids, classes, confs)
                 
-                # Count detections and collect details
-                for result in results:
-                    boxes = result.boxes
-                    for box in boxes:
-                        cls_id = int(box.cls[0].item())
-                        conf = box.conf[0].item()
-                        
-                        if cls_id == 0:
-                            total_detections['with_helmet'] += 1
-                        elif cls_id == 1:
-                            total_detections['no_helmet'] += 1
-                        elif cls_id == 2:
-                            total_detections['motorcycle'] += 1
-                        
-                        details.append({
-                            'class': CLASS_NAMES.get(cls_id, 'unknown'),
-                            'confidence': f"{conf:.2%}",
-                            'frame': frame_count
-                        })
-                
-                detected_frames += 1
-                last_frame = annotated_frame
-                if preview_frame is None:
-                    preview_frame = annotated_frame
-            else:
-                # Reuse last annotated frame
-                if last_frame is not None:
-                    annotated_frame = last_frame
-                else:
-                    annotated_frame = frame
+                counts = np.bincount(classes, minlength=3)
+                sample = {
+                    'frame': index + 1,
+                    'time_s': round(index / fps, 2),
+                    'with_helmet': int(counts[0]),
+                    'no_helmet': int(counts[1]),
+                    'motorcycle': int(counts[2]),
+                    'boxes': extract_boxes(result),
+                    'reused': reuse,
+                }
+                for box, track_id in zip(sample['boxes'], track_ids):
+                    box['track_id'] = track_id
+                for key in total_detections:
+                    total_detections[key] += sample[key]
+                samples.append(sample)
             
-            out.write(annotated_frame)
-        
-        if cap is not None:
-            cap.release()
-        if out is not None:
-            out.release()
+            if progress_callback is not None:
+                progress_callback(len(samples), total_samples)
         
-        # Cleanup input temp file
+        pipeline_start = time.perf_counter()
+        decoder = threading.Thread(target=decode_samples, name='video-analytics-decode', daemon=True)
+        decoder.start()
         try:
-            os.unlink(temp_input.name)
-        except:
-            pass
-        
-        # Convert to web-compatible MP4 using FFmpeg
-        unique_filename = f"video_{uuid.uuid4().hex}.mp4"
-        final_output_path = TEMP_VIDEO_DIR / unique_filename
-        
-        if FFMPEG_AVAILABLE:
-            logger.info("Converting to web-compatible MP4...")
-            success = convert_to_web_compatible_mp4(temp_output_raw.name, final_output_path)
-            
-            if not success:
-                logger.warning("FFmpeg conversion failed, using raw video")
-                shutil.move(temp_output_raw.name, final_output_path)
-            else:
-                # Cleanup raw temp file
-                try:
-                    os.unlink(temp_output_raw.name)
-                except:
-                    pass
-        else:
-            logger.warning("FFmpeg not available, using raw video (may not play in browser)")
-            shutil.move(temp_output_raw.name, final_output_path)
+            batch = []
+            while True:
+                item = get_until_stopped(decoded_queue, stop_event)
+                if item is _PIPELINE_DONE:
+                    break
+                batch.append(item)
+                # A reused sample needs the result of the sample before it
+                if len(batch) >= batch_size or item[2]:
+                    predict_batch(batch)
+                    batch = []
+            if batch and not stop_event.is_set():
+                predict_batch(batch)
+        finally:
+            stop_event.set()
+            decoder.join()
+        wall_time = time.perf_counter() - pipeline_start
         
-        # Convert preview frame to base64
-        preview_image_base64 = None
-        if preview_frame is not None:
-            _, buffer = cv2.imencode('.jpg', preview_frame)
-            preview_image_base64 = f"data:image/jpeg;base64,{base64.b64encode(buffer).decode('utf-8')}"
+        if errors:
+            raise errors[0]
+        if isinstance(cap, FFmpegPipeReader) and cap.failed():
+            raise VideoDecodeError(f"Video decoding failed: {cap.error_message()}")
         
-        # Return response
-        response_data = {
-            'with_helmet': total_detections['with_helmet'],
-            'no_helmet': total_detections['no_helmet'],
-            'motorcycle': total_detections['motorcycle'],
-            'details': details,
-            'preview_image': preview_image_base64,
-            'video_path': f"/api/video/{unique_filename}",
+        unique_counts, tracks = counter.finish()
+        total_frames = total_frames or decode_stats['frames']
+        duration = total_frames / fps
+        return {
+            'unique_counts': unique_counts,
+            'total_detections': total_detections,
+            'tracks': tracks,
+            'samples': samples,
             'total_frames': total_frames,
-            'processed_frames': detected_frames,
-            'ffmpeg_converted': FFMPEG_AVAILABLE
+            'duration_s': round(duration, 2),
+            'processed_frames': inferred_samples,
+            'samples_per_second': samples_per_second,
+            'seeks': decode_stats['seeks'],
+            'grabbed_frames': decode_stats['grabbed_frames'],
+            'batch_size': batch_size,
+            'decode': {
+                'decoder': 'ffmpeg' if isinstance(cap, FFmpegPipeReader) else 'opencv',
+                'width': width,
+                'height': height,
+                'hwaccel': cap.hwaccel if isinstance(cap, FFmpegPipeReader) else None,
+            },
+            'stage_latency': {
+                'decode_ms': round(decode_stats['seconds'] / len(samples) * 1000, 2) if samples else 0.0,
+                'motion_ms': round(decode_stats['motion_seconds'] / len(samples) * 1000, 2) if samples else 0.0,
+                'inference_ms': round(inference_seconds / inferred_samples * 1000, 2) if inferred_samples else 0.0,
+                'total_s': round(wall_time, 3),
+            },
+            'motion_gate': motion_gate.stats() if motion_gate is not None else None,
+            # Processing time as a fraction of the footage duration
+            'realtime_factor': round(wall_time / duration, 4) if duration else None,
         }
-        
-        return jsonify(response_data)
-    
-    except Exception as e:
-        logger.error(f"Error in detect_video: {e}")
-        # Cleanup on error
-        if cap is not None:
-            cap.release()
-        if out is not None:
-            out.release()
-        if temp_input is not None:
+    finally:
+        cap.release()
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Content hash of a file, read in chunks so large videos are not loaded into memory"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def compute_model_version(model):
+    """Identify the loaded weights for cache keys (content hash of the checkpoint file)"""
+    if model is None:
+        return None
+    weights = getattr(model, 'ckpt_path', None) or getattr(model, 'model_name', None)
+    if weights and Path(weights).is_file():
+        return file_sha256(weights)[:16]
+    return str(weights)
+
+class ImageResultCache:
+    """In-memory LRU cache of detect-image results, bounded by entry count and total bytes"""
+    
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def make_key(image_data, confidence_threshold, output_mode, region=None):
+        return (hashlib.sha256(image_data).hexdigest(), round(confidence_threshold, 4), output_mode,
+                region.key() if region is not None else None, MODEL_VERSION)
+    
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+    
+    def put(self, key, value, size):
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.total_bytes += size
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+    
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+class VideoResultCache:
+    """
+    On-disk cache of processed videos in TEMP_VIDEO_DIR
+    Each entry is a JSON file with the detect-video payload next to the MP4 it points to;
+    least recently used entries are evicted when cached MP4s exceed max_bytes
+    """
+    
+    def __init__(self, cache_dir, max_bytes=2048 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+    
+    # Bump when the payload changes meaning so stale entries are not served
+    RESULT_FORMAT = 2
+    
+    @staticmethod
+    def make_key(file_hash, confidence_threshold, sample_rate, region=None, decode_width=0, motion_gate=None,
+                 sampler=None):
+        region_key = region.key() if region is not None else ''
+        motion_key = motion_gate.key() if motion_gate is not None else ''
+        if sampler is not None:
+            sample_rate = f"{sample_rate}~{sampler.key()}"
+        raw_key = (f"{file_hash}:{round(confidence_threshold, 4)}:{sample_rate}:{region_key}:{decode_width}"
+                   f":{motion_key}:{MODEL_VERSION}:{VideoResultCache.RESULT_FORMAT}")
+        return hashlib.sha256(raw_key.encode('utf-8')).hexdigest()
+    
+    def _video_file(self, payload):
+        """Output MP4 of an entry, None for analytics-only results"""
+        if not payload.get('video_path'):
+            return None
+        return TEMP_VIDEO_DIR / payload['video_path'].rsplit('/', 1)[-1]
+    
+    def get(self, key):
+        entry_path = self.cache_dir / f"{key}.json"
+        with self.lock:
             try:
-                os.unlink(temp_input.name)
-            except:
-                pass
-        if temp_output_raw is not None:
+                with open(entry_path) as f:
+                    payload = json.load(f)
+            except (OSError, ValueError):
+                self.misses += 1
+                return None
+            
+            # Output video was removed behind our back, drop the stale entry
+            video_file = self._video_file(payload)
+            if video_file is not None and not video_file.exists():
+                entry_path.unlink(missing_ok=True)
+                self.misses += 1
+                return None
+            
+            os.utime(entry_path)  # mark as recently used
+            self.hits += 1
+            return payload
+    
+    def put(self, key, payload):
+        if self.max_bytes <= 0:
+            return
+        with self.lock:
+            with open(self.cache_dir / f"{key}.json", 'w') as f:
+                json.dump(payload, f)
+            self._evict()
+    
+    def _entries(self):
+        """(mtime, entry_path, video_path, size) of every cache entry, oldest first (size includes the JSON)"""
+        entries = []
+        for entry_path in self.cache_dir.glob('*.json'):
+            try:
+                with open(entry_path) as f:
+                    video_file = self._video_file(json.load(f))
+                stat = entry_path.stat()
+                size = stat.st_size
+                if video_file is not None and video_file.exists():
+                    size += video_file.stat().st_size
+                entries.append((stat.st_mtime, entry_path, video_file, size))
+            except (OSError, ValueError):
+                continue
+        return sorted(entries, key=lambda entry: entry[0])
+    
+    def _evict(self):
+        entries = self._entries()
+        total = sum(entry[3] for entry in entries)
+        for _, entry_path, video_file, size in entries:
+            if total <= self.max_bytes:
+                break
+            entry_path.unlink(missing_ok=True)
+            if video_file is not None:
+                video_file.unlink(missing_ok=True)
+            total -= size
+    
+    def stats(self):
+        with self.lock:
+            entries = self._entries()
+            return {
+                'entries': len(entries),
+                'bytes': sum(entry[3] for entry in entries),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+MODEL_VERSION = None
+image_result_cache = ImageResultCache(IMAGE_CACHE_SIZE, int(IMAGE_CACHE_MAX_MB * 1024 * 1024))
+video_result_cache = VideoResultCache(TEMP_VIDEO_DIR / 'cache', int(VIDEO_CACHE_MAX_MB * 1024 * 1024))
+
+class MicroBatcher:
+    """
+    Coalesce concurrent single-image predictions into one batched forward pass
+    Requests arriving within max_wait_ms of the first one (up to max_batch) share a batch;
+    each result is filtered back to the confidence threshold of its own request
+    """
+    
+    def __init__(self, max_batch=8, max_wait_ms=10, latency_window=1000, num_dispatchers=1):
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self.requests = queue.Queue()
+        self.latencies = deque(maxlen=latency_window)
+        self.batch_sizes = deque(maxlen=latency_window)
+        self.stats_lock = threading.Lock()
+        # One dispatcher per inference worker so batches are predicted in parallel
+        self.threads = [
+            threading.Thread(target=self._dispatch_loop, name=f'image-batcher-{i}', daemon=True)
+            for i in range(max(1, num_dispatchers))
+        ]
+        for thread in self.threads:
+            thread.start()
+    
+    def submit(self, image, confidence_threshold):
+        """Queue an image and block until its result is ready, returns the list of results"""
+        request_item = {
+            'image': image,
+            'conf': confidence_threshold,
+            'submitted_at': time.perf_counter(),
+            'done': threading.Event(),
+            'result': None,
+            'error': None,
+        }
+        self.requests.put(request_item)
+        request_item['done'].wait()
+        
+        with self.stats_lock:
+            self.latencies.append(time.perf_counter() - request_item['submitted_at'])
+        
+        if request_item['error'] is not None:
+            raise request_item['error']
+        return [request_item['result']]
+    
+    def _collect_batch(self):
+        batch = [self.requests.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
             try:
-                os.unlink(temp_output_raw.name)
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+    
+    def _dispatch_loop(self):
+        while True:
+            batch = self._collect_batch()
+            try:
+                # Predict once at the lowest threshold in the batch, then filter per request
+                min_conf = min(item['conf'] for item in batch)
+                with inference_lock:
+                    results = model.predict([item['image'] for item in batch], conf=min_conf, verbose=False)
+                for item, result in zip(batch, results):
+                    if item['conf'] > min_conf:
+                        result = result[result.boxes.conf >= item['conf']]
+                    item['result'] = result
+            except Exception as e:
+                for item in batch:
+                    item['error'] = e
+            finally:
+                with self.stats_lock:
+                    self.batch_sizes.append(len(batch))
+                for item in batch:
+                    item['done'].set()
+    
+    def stats(self):
+        """p50/p95 request latency (ms) and batch size over the recent window"""
+        with self.stats_lock:
+            latencies = np.array(self.latencies) * 1000
+            batch_sizes = np.array(self.batch_sizes)
+        
+        return {
+            'max_batch': self.max_batch,
+            'max_wait_ms': self.max_wait * 1000,
+            'requests': int(latencies.size),
+            'latency_p50_ms': round(float(np.percentile(latencies, 50)), 2) if latencies.size else None,
+            'latency_p95_ms': round(float(np.percentile(latencies, 95)), 2) if latencies.size else None,
+            'avg_batch_size': round(float(batch_sizes.mean()), 2) if batch_sizes.size else None,
+            'queue_depth': self.requests.qsize(),
+        }
+
+# Created by start_backend(), never in spawned inference workers
+image_batcher = None
+
+def create_session_tracker():
+    """
+    ByteTrack instance owned by a single camera session
+    (model.track(persist=True) keeps one tracker on the shared predictor, mixing IDs between cameras)
+    """
+    from ultralytics.trackers.byte_tracker import BYTETracker
+    from ultralytics.utils import IterableSimpleNamespace
+    from ultralytics.utils.checks import check_yaml
+    import yaml
+    
+    with open(check_yaml('bytetrack.yaml')) as f:
+        tracker_cfg = IterableSimpleNamespace(**yaml.safe_load(f))
+    try:
+        return BYTETracker(tracker_cfg, frame_rate=30)
+    except TypeError:
+        # Newer ultralytics versions take frame rate from the config only
+        return BYTETracker(tracker_cfg)
+
+class CameraSession:
+    """
+    Live detection state of one WebSocket camera connection
+    Only the newest received frame is kept; frames arriving while inference is busy replace
+    the pending one (counted as dropped) so results never lag behind the camera
+    """
+    
+    def __init__(self, ws):
+        self.ws = ws
+        self.confidence_threshold = 0.5
+        self.region = None
+        self.track = True
+        self.tracker = None
+        self.pending = None
+        self.frame_id = 0
+        self.dropped_frames = 0
+        self.running = True
+        self.condition = threading.Condition()
+        self.worker = threading.Thread(target=self._inference_loop, name='camera-session', daemon=True)
+    
+    def push_frame(self, data):
+        with self.condition:
+            self.frame_id += 1
+            if self.pending is not None:
+                self.dropped_frames += 1
+            self.pending = (self.frame_id, data, time.perf_counter())
+            self.condition.notify()
+    
+    def configure(self, message):
+        """
+        Apply a JSON control message, e.g. {"confidence_threshold": 0.4, "track": false}
+        or {"camera_id": "gate-1"} / {"roi": [[0, 0.4], [1, 0.4], [1, 1], [0, 1]], "tiled": true}
+        An invalid message is answered with an error message and changes nothing, the session stays open
+        """
+        try:
+            config = json.loads(message)
+            if not isinstance(config, dict):
+                raise ValueError('Control messages must be JSON objects')
+            confidence_threshold = self.confidence_threshold
+            if 'confidence_threshold' in config:
+                confidence_threshold = float(config['confidence_threshold'])
+            region = self.region
+            if 'camera_id' in config or any(key in config for key in REGION_OPTIONS):
+                region = detection_region(config)
+        except (ValueError, TypeError) as e:
+            # Also covers RegionConfigError and invalid JSON
+            self._send({'type': 'error', 'error': f"Invalid control message: {e}"})
+            return
+        
+        self.confidence_threshold = confidence_threshold
+        self.region = region
+        if 'track' in config:
+            self.track = bool(config['track'])
+            if not self.track:
+                self.tracker = None
+    
+    def close(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+    
+    def _next_frame(self):
+        with self.condition:
+            while self.running and self.pending is None:
+                self.condition.wait()
+            frame, self.pending = self.pending, None
+            return frame
+    
+    def _inference_loop(self):
+        while True:
+            item = self._next_frame()
+            if item is None:
+                return
+            frame_id, data, received_at = item
+            
+            image = decode_image_bytes(data)
+            if image is None:
+                self._send({'type': 'error', 'frame_id': frame_id, 'error': 'Failed to decode frame'})
+                continue
+            
+            try:
+                # ROI crops / tiles are already a batch, only whole frames go through the micro-batcher
+                if image_batcher is not None and self.region is None:
+                    result = image_batcher.submit(image, self.confidence_threshold)[0]
+                else:
+                    result = predict_frames([image], self.confidence_threshold, self.region)[0]
+                boxes = self._track_boxes(result, image) if self.track else extract_boxes(result)
+            except Exception as e:
+                logger.error(f"Camera session inference failed: {e}")
+                self._send({'type': 'error', 'frame_id': frame_id, 'error': str(e)})
+                continue
+            
+            message = {
+                'type': 'detections',
+                'frame_id': frame_id,
+                'with_helmet': sum(1 for box in boxes if box['class_id'] == 0),
+                'no_helmet': sum(1 for box in boxes if box['class_id'] == 1),
+                'motorcycle': sum(1 for box in boxes if box['class_id'] == 2),
+                'boxes': boxes,
+                'latency_ms': round((time.perf_counter() - received_at) * 1000, 1),
+                'dropped_frames': self.dropped_frames,
+            }
+            if not self._send(message):
+                return
+    
+    def _track_boxes(self, result, image):
+        """Update the session ByteTrack with this frame's detections, boxes carry a persistent track_id"""
+        if self.tracker is None:
+            self.tracker = create_session_tracker()
+        
+        tracks = self.tracker.update(result.boxes.cpu().numpy(), image)
+        height, width = image.shape[:2]
+        
+        # tracks rows: x1, y1, x2, y2, track_id, score, cls, det_index
+        return [
+            {
+                'class_id': int(cls_id),
+                'class': CLASS_NAMES.get(int(cls_id), 'unknown'),
+                'confidence': round(float(score), 4),
+                'box': [round(float(x1) / width, 5), round(float(y1) / height, 5),
+                        round(float(x2) / width, 5), round(float(y2) / height, 5)],
+                'track_id': int(track_id),
+            }
+            for x1, y1, x2, y2, track_id, score, cls_id, *_ in tracks
+        ]
+    
+    def _send(self, message):
+        try:
+            self.ws.send(json.dumps(message, separators=(',', ':')))
+            return True
+        except Exception:
+            self.close()
+            return False
+
+def camera_stream(ws):
+    """
+    WebSocket live camera detection (/ws/camera)
+    Client sends JPEG frames as binary messages and optional JSON text control messages,
+    server pushes compact JSON detections (with ByteTrack IDs) for the newest frame
+    """
+    if not model_ready.is_set() or model is None:
+        ws.send(json.dumps({'type': 'error', 'error': 'Model not loaded'}))
+        return
+    
+    session = CameraSession(ws)
+    ws.send(json.dumps({
+        'type': 'hello',
+        'classes': CLASS_NAMES,
+        'colors': {cls_id: list(color) for cls_id, color in CLASS_COLORS.items()},
+    }))
+    session.worker.start()
+    
+    try:
+        while session.running:
+            message = ws.receive()
+            if message is None:
+                break
+            if isinstance(message, (bytes, bytearray)):
+                session.push_frame(message)
+            else:
+                session.configure(message)
+    except Exception as e:
+        logger.info(f"Camera session closed: {e}")
+    finally:
+        session.close()
+        session.worker.join(timeout=5)
+
+if sock is not None:
+    sock.route('/ws/camera')(camera_stream)
+
+def model_unavailable():
+    """Error response while the model is still warming up or failed to load, None when ready"""
+    if not model_ready.is_set():
+        return jsonify({'error': 'Model is warming up, try again shortly'}), 503
+    if model is None:
+        return jsonify({'error': 'Model not loaded'}), 500
+    return None
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """Health check endpoint, 503 until the model is loaded and warmed up"""
+    ready = model_ready.is_set()
+    return jsonify({
+        'status': 'ok' if ready else 'starting',
+        'ready': ready,
+        'model_loaded': model is not None,
+        'ffmpeg_available': _ffmpeg_available,
+        'model_path': str(model_path),
+        'model_backend': model_backend,
+        'startup_mode': STARTUP_MODE,
+        'startup_timings': startup_timings,
+        'inference_workers': alive_inference_workers()
+    }), 200 if ready else 503
+
+def alive_inference_workers():
+    """Running worker processes (0 when the model runs in the Flask process)"""
+    return model.alive_workers() if isinstance(model, InferenceWorkerPool) else 0
+
+def image_queue_depth():
+    """Images waiting for the micro-batcher (0 when micro-batching is off)"""
+    return image_batcher.requests.qsize() if image_batcher is not None else 0
+
+def readiness_problems():
+    """Reasons this instance should not receive traffic (empty list when ready)"""
+    problems = []
+    if not model_ready.is_set():
+        problems.append('model warming up')
+    elif model is None:
+        problems.append('model not loaded')
+    if image_queue_depth() >= READY_MAX_IMAGE_QUEUE:
+        problems.append('image inference queue saturated')
+    if count_active_video_jobs() >= VIDEO_JOB_WORKERS + MAX_PENDING_VIDEO_JOBS:
+        problems.append('video job queue full')
+    if isinstance(model, InferenceWorkerPool) and alive_inference_workers() < model.num_workers:
+        problems.append('inference worker down')
+    return problems
+
+@app.route('/health/live', methods=['GET'])
+def liveness_check():
+    """Liveness probe, the process is up and serving requests"""
+    return jsonify({'status': 'alive'})
+
+@app.route('/health/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe, 503 while the model is loading or the inference queues are saturated"""
+    problems = readiness_problems()
+    return jsonify({
+        'ready': not problems,
+        'problems': problems,
+        'image_queue_depth': image_queue_depth(),
+        'active_video_jobs': count_active_video_jobs(),
+    }), 503 if problems else 200
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Count requests and observe latency per endpoint (route pattern, not raw path)"""
+    if prometheus_client is not None and 'request_started' in g:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_COUNT.labels(endpoint, request.method, response.status_code).inc()
+        REQUEST_LATENCY.labels(endpoint).observe(time.perf_counter() - g.request_started)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics (requests, latency, stage timings, video throughput, queues, disk)"""
+    if prometheus_client is None:
+        return jsonify({'error': 'prometheus-client not installed'}), 501
+    return Response(prometheus_client.generate_latest(), mimetype=prometheus_client.CONTENT_TYPE_LATEST)
+
+def image_output_mode(options):
+    """'boxes', 'jpeg' or 'json' depending on what the client asked for"""
+    if wants_boxes_only(options):
+        return 'boxes'
+    if wants_jpeg_response(options):
+        return 'jpeg'
+    return 'json'
+
+def run_image_detection(image, confidence_threshold, output_mode, region=None):
+    """
+    Detect, count and (unless output_mode is 'boxes') annotate a single image
+    Returns (detections, jpeg_bytes), jpeg_bytes is only set for output_mode 'jpeg'
+    """
+    # Run detection
+    start = time.perf_counter()
+    if image_batcher is not None and region is None:
+        results = image_batcher.submit(image, confidence_threshold)
+    else:
+        results = predict_frames([image], confidence_threshold, region)
+    observe_stage('image', 'inference', time.perf_counter() - start)
+    
+    start = time.perf_counter()
+    boxes_only = output_mode == 'boxes'
+    
+    # Annotate image with detections (in place, the decoded upload is not needed afterwards)
+    annotated_image = image
+    
+    # Process detections
+    detections = {
+        'with_helmet': 0,
+        'no_helmet': 0,
+        'motorcycle': 0,
+        'details': [],
+        'processed_image': None
+    }
+    if region is not None:
+        detections['region'] = region.describe()
+    
+    for result in results:
+        boxes, classes, confs, track_ids = result_arrays(result)
+        if not boxes_only:
+            draw_boxes(annotated_image, BOX_STYLE, boxes, classes, confs, track_ids)
+        count_detections(classes, confs, detections, detections['details'])
+    
+    # Boxes only: normalized coordinates, the client draws the overlay itself
+    if boxes_only:
+        detections['boxes'] = [box for result in results for box in extract_boxes(result)]
+        detections['image_width'] = image.shape[1]
+        detections['image_height'] = image.shape[0]
+        observe_stage('image', 'annotate', time.perf_counter() - start)
+        return detections, None
+    observe_stage('image', 'annotate', time.perf_counter() - start)
+    
+    start = time.perf_counter()
+    _, buffer = cv2.imencode('.jpg', annotated_image)
+    observe_stage('image', 'encode', time.perf_counter() - start)
+    
+    if output_mode == 'jpeg':
+        del detections['processed_image']
+        return detections, buffer.tobytes()
+    
+    # Convert annotated image to base64
+    processed_image_base64 = base64.b64encode(buffer).decode('utf-8')
+    detections['processed_image'] = f"data:image/jpeg;base64,{processed_image_base64}"
+    return detections, None
+
+def image_response(detections, jpeg_bytes, cache_hit):
+    """Build the detect-image response, raw JPEG body when jpeg_bytes is given"""
+    if jpeg_bytes is not None:
+        # Raw JPEG body, detections go in the X-Detections header
+        response = Response(jpeg_bytes, mimetype='image/jpeg')
+        response.headers['X-Detections'] = json.dumps(detections, separators=(',', ':'))
+        response.headers['X-Cache'] = 'HIT' if cache_hit else 'MISS'
+        return response
+    return jsonify({**detections, 'cache_hit': cache_hit})
+
+@app.route('/api/detect-image', methods=['POST'])
+def detect_image():
+    """
+    Detect helmet in image
+    Body: JSON base64, multipart/form-data or raw JPEG bytes; response_format=jpeg (or
+    Accept: image/jpeg) returns the annotated image as image/jpeg instead of base64 JSON,
+    mode=boxes (or return_image=false) returns normalized boxes only without annotation.
+    camera_id (or roi / tiled options) restricts detection to ROI polygons and tiles the frame.
+    Results are cached by image content hash (see X-Cache header / cache_hit field)
+    """
+    unavailable = model_unavailable()
+    if unavailable is not None:
+        return unavailable
+    
+    try:
+        image_data, options = read_image_request()
+        confidence_threshold = float(options.get('confidence_threshold', 0.5))
+        
+        if image_data is None:
+            return jsonify({'error': 'No image provided'}), 400
+        if not image_data:
+            return jsonify({'error': 'Failed to decode image'}), 400
+        
+        output_mode = image_output_mode(options)
+        region = detection_region(options)
+        cache_key = image_result_cache.make_key(image_data, confidence_threshold, output_mode, region)
+        cached = image_result_cache.get(cache_key)
+        if cached is not None:
+            return image_response(*cached, cache_hit=True)
+        
+        # Decode image
+        start = time.perf_counter()
+        image = decode_image_bytes(image_data)
+        observe_stage('image', 'decode', time.perf_counter() - start)
+        if image is None:
+            return jsonify({'error': 'Failed to decode image'}), 400
+        
+        detections, jpeg_bytes = run_image_detection(image, confidence_threshold, output_mode, region)
+        
+        entry_size = len(jpeg_bytes or b'') + len(detections.get('processed_image') or '') + 1024
+        image_result_cache.put(cache_key, (detections, jpeg_bytes), entry_size)
+        
+        return image_response(detections, jpeg_bytes, cache_hit=False)
+    
+    except RegionConfigError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in detect_image: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def process_video_upload(upload, confidence_threshold=0.5, sample_rate=5, batch_size=0,
+                         progress_callback=None, region=None, decode_width=0, motion_gate=None, sampler=None):
+    """
+    Process a VideoUpload into a web-compatible MP4
+    While the upload is still arriving, streamable containers are decoded through an FFmpeg pipe
+    as the bytes come in (the result cache is only consulted for complete uploads); other videos
+    are processed once fully received. Returns the /api/detect-video response payload, temp files
+    are always cleaned up and the upload is cancelled if processing fails
+    """
+    temp_output_raw = None
+    capture = None
+    # Set as soon as the upload is complete and its hash known, whichever decode path runs
+    cache_key = None
+    
+    def result_cache_key():
+        return video_result_cache.make_key(upload.file_hash, confidence_threshold, sample_rate, region,
+                                           decode_width, motion_gate, sampler)
+    
+    try:
+        if not upload.complete and upload.streamable and ffmpeg_available():
+            capture = FFmpegPipeReader(upload, max_width=decode_width, hwaccel=VIDEO_HWACCEL)
+            logger.info(f"Decoding {upload.container} upload while it is being received")
+        else:
+            upload.wait_complete()
+            cache_key = result_cache_key()
+            cached = video_result_cache.get(cache_key)
+            if cached is not None:
+                logger.info("✅ Video result served from cache")
+                return {**cached, 'cache_hit': True}
+        
+        unique_filename = f"video_{uuid.uuid4().hex}.mp4"
+        final_output_path = TEMP_VIDEO_DIR / unique_filename
+        
+        stats = None
+        ffmpeg_converted = False
+        detection_args = {
+            'confidence_threshold': confidence_threshold,
+            'sample_rate': sample_rate,
+            'batch_size': batch_size,
+            'progress_callback': progress_callback,
+            'region': region,
+            'decode_width': decode_width,
+            'motion_gate': motion_gate,
+            'sampler': sampler,
+        }
+        
+        # Single pass: stream annotated frames straight into FFmpeg (H.264 MP4)
+        if ffmpeg_available():
+            try:
+                stats = run_video_detection(upload.path, final_output_path, ffmpeg_pipe=True,
+                                            capture=capture, **detection_args)
+                ffmpeg_converted = True
+            except FFmpegPipeError as e:
+                logger.warning(f"FFmpeg pipe failed, falling back to XVID + conversion: {e}")
+                try:
+                    os.unlink(final_output_path)
+                except:
+                    pass
+        
+        if stats is None:
+            # The fallback decodes the saved file, the pipe reader (if any) is spent
+            capture = None
+            upload.wait_complete()
+            cache_key = result_cache_key()
+            
+            # Create temporary output video (raw, before FFmpeg conversion)
+            temp_output_raw = tempfile.NamedTemporaryFile(delete=False, suffix='_raw.avi')
+            temp_output_raw.close()
+            
+            stats = run_video_detection(upload.path, temp_output_raw.name, **detection_args)
+            
+            # Convert to web-compatible MP4 using FFmpeg
+            if ffmpeg_available():
+                logger.info("Converting to web-compatible MP4...")
+                start = time.perf_counter()
+                ffmpeg_converted = convert_to_web_compatible_mp4(temp_output_raw.name, final_output_path)
+                observe_ffmpeg('convert', time.perf_counter() - start)
+                
+                if not ffmpeg_converted:
+                    logger.warning("FFmpeg conversion failed, using raw video")
+                    shutil.move(temp_output_raw.name, final_output_path)
+            else:
+                logger.warning("FFmpeg not available, using raw video (may not play in browser)")
+                shutil.move(temp_output_raw.name, final_output_path)
+        
+        if capture is not None and capture.failed():
+            raise VideoDecodeError(f"Video decoding failed: {capture.error_message()}")
+        if cache_key is None:
+            # Streamed decoding reached the end of the upload, its hash is known now
+            upload.wait_complete()
+            cache_key = result_cache_key()
+        
+        unique_counts = stats['unique_counts']
+        preview_frame = stats['preview_frame']
+        
+        # Convert preview frame to base64
+        preview_image_base64 = None
+        if preview_frame is not None:
+            _, buffer = cv2.imencode('.jpg', preview_frame)
+            preview_image_base64 = f"data:image/jpeg;base64,{base64.b64encode(buffer).decode('utf-8')}"
+        
+        # Unique tracked objects; detection_counts are the per-sampled-frame sums
+        response_data = {
+            'with_helmet': unique_counts['with_helmet'],
+            'no_helmet': unique_counts['no_helmet'],
+            'motorcycle': unique_counts['motorcycle'],
+            'detection_counts': stats['total_detections'],
+            'tracks': stats['tracks'],
+            'details': stats['details'],
+            'preview_image': preview_image_base64,
+            'video_path': f"/api/video/{unique_filename}",
+            'total_frames': stats['total_frames'],
+            'processed_frames': stats['processed_frames'],
+            'batch_size': stats['batch_size'],
+            'stage_latency': stats['stage_latency'],
+            'decode': stats['decode'],
+            'motion_gate': stats['motion_gate'],
+            'adaptive_sampling': stats['adaptive_sampling'],
+            'ffmpeg_converted': ffmpeg_converted
+        }
+        if region is not None:
+            response_data['region'] = region.describe()
+        if cache_key is not None:
+            video_result_cache.put(cache_key, response_data)
+        
+        return {**response_data, 'cache_hit': False}
+    
+    except Exception as e:
+        upload.cancel(str(e))
+        raise
+    
+    finally:
+        # Cleanup input and raw temp files (raw file is gone already if it was moved)
+        for path in (upload.path, temp_output_raw.name if temp_output_raw is not None else None):
+            if path is None:
+                continue
+            try:
+                os.unlink(path)
             except:
                 pass
+
+def process_video_analytics(upload, confidence_threshold=0.5, samples_per_second=ANALYTICS_SAMPLES_PER_SECOND,
+                            batch_size=0, progress_callback=None, region=None, motion_gate=None, decode_width=0):
+    """
+    Analytics-only /api/detect-video run (mode=analytics): unique counts, tracks and per-sample
+    detections, no annotated video or FFmpeg encoding. Seeking needs the whole file, so this waits
+    for the upload to complete. The upload is cancelled if processing fails and always deleted
+    """
+    try:
+        upload.wait_complete()
+        cache_key = video_result_cache.make_key(upload.file_hash, confidence_threshold,
+                                                f"analytics@{samples_per_second}", region, decode_width, motion_gate)
+        cached = video_result_cache.get(cache_key)
+        if cached is not None:
+            logger.info("✅ Video analytics served from cache")
+            return {**cached, 'cache_hit': True}
+        
+        stats = run_video_analytics(upload.path, confidence_threshold, samples_per_second, batch_size,
+                                    progress_callback, region, motion_gate, decode_width)
+        unique_counts = stats.pop('unique_counts')
+        response_data = {
+            'mode': 'analytics',
+            'with_helmet': unique_counts['with_helmet'],
+            'no_helmet': unique_counts['no_helmet'],
+            'motorcycle': unique_counts['motorcycle'],
+            'detection_counts': stats.pop('total_detections'),
+            'video_path': None,
+            'preview_image': None,
+            **stats,
+        }
+        if region is not None:
+            response_data['region'] = region.describe()
+        video_result_cache.put(cache_key, response_data)
+        
+        return {**response_data, 'cache_hit': False}
+    
+    except Exception as e:
+        upload.cancel(str(e))
+        raise
+    
+    finally:
+        try:
+            os.unlink(upload.path)
+        except OSError:
+            pass
+
+# Async video jobs: job_id -> job dict (state, progress, result/error)
+video_jobs = {}
+video_jobs_lock = threading.Lock()
+video_job_executor = ThreadPoolExecutor(max_workers=VIDEO_JOB_WORKERS, thread_name_prefix='video-job')
+
+def count_active_video_jobs():
+    """Queued + running async video jobs"""
+    return sum(1 for job in list(video_jobs.values()) if job['state'] in ('queued', 'running'))
+
+def prune_video_jobs():
+    """Forget finished jobs older than VIDEO_JOB_TTL seconds"""
+    now = time.time()
+    with video_jobs_lock:
+        expired = [
+            job_id for job_id, job in video_jobs.items()
+            if job['finished_at'] is not None and now - job['finished_at'] > VIDEO_JOB_TTL
+        ]
+        for job_id in expired:
+            del video_jobs[job_id]
+
+def run_video_job(job_id, upload, process, detection_args):
+    """Worker entry point, never raises so a failing job cannot kill the pool"""
+    job = video_jobs[job_id]
+    job['state'] = 'running'
+    job['started_at'] = time.time()
+    
+    def update_progress(written_frames, total_frames):
+        job['processed_frames'] = written_frames
+        job['total_frames'] = total_frames
+    
+    try:
+        job['result'] = process(upload, progress_callback=update_progress, **detection_args)
+        job['state'] = 'done'
+    except Exception as e:
+        logger.error(f"Video job {job_id} failed: {e}")
+        job['error'] = str(e)
+        job['state'] = 'failed'
+    finally:
+        job['finished_at'] = time.time()
+
+def submit_video_job(upload, process, detection_args):
+    """
+    Queue process(upload, **detection_args) (process_video_upload or process_video_analytics) for
+    background processing, returns the job id or None if the queue is full
+    """
+    prune_video_jobs()
+    
+    with video_jobs_lock:
+        if count_active_video_jobs() >= VIDEO_JOB_WORKERS + MAX_PENDING_VIDEO_JOBS:
+            return None
+        
+        job_id = uuid.uuid4().hex
+        video_jobs[job_id] = {
+            'id': job_id,
+            'state': 'queued',
+            'processed_frames': 0,
+            'total_frames': 0,
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'result': None,
+            'error': None,
+        }
+    
+    video_job_executor.submit(run_video_job, job_id, upload, process, detection_args)
+    return job_id
+
+def serialize_video_job(job):
+    """Job status payload for GET /api/jobs/<id>"""
+    processed = job['processed_frames']
+    total = job['total_frames']
+    
+    eta_seconds = None
+    if job['state'] == 'running' and processed > 0 and total > 0:
+        elapsed = time.time() - job['started_at']
+        eta_seconds = round(elapsed / processed * max(total - processed, 0), 1)
+    elif job['state'] == 'done':
+        eta_seconds = 0
+    
+    return {
+        'job_id': job['id'],
+        'state': job['state'],
+        'processed_frames': processed,
+        'total_frames': total,
+        'progress': round(processed / total, 4) if total else 0.0,
+        'eta_seconds': eta_seconds,
+        'result': job['result'],
+        'error': job['error'],
+    }
+
+def iter_video_upload(form):
+    """
+    Yield the uploaded video bytes straight from the request stream (nothing is spooled by werkzeug)
+    multipart/form-data is parsed incrementally, text fields are stored in form as they are parsed;
+    any other content type is taken as the raw video with its options in the query string
+    """
+    stream = request.stream
+    if request.mimetype != 'multipart/form-data':
+        while True:
+            chunk = stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+    
+    boundary = request.mimetype_params.get('boundary')
+    if not boundary:
+        raise ValueError('Missing multipart boundary')
+    decoder = MultipartDecoder(boundary.encode('latin-1'))
+    part_name, in_video, field_value = None, False, bytearray()
+    
+    while True:
+        data = stream.read(UPLOAD_CHUNK_SIZE)
+        decoder.receive_data(data or None)
+        event = decoder.next_event()
+        while not isinstance(event, (NeedData, Epilogue)):
+            if isinstance(event, File):
+                part_name, in_video = None, event.name == 'video'
+            elif isinstance(event, Field):
+                part_name, in_video = event.name, False
+                field_value.clear()
+            elif isinstance(event, Data):
+                if in_video:
+                    if event.data:
+                        yield event.data
+                elif part_name is not None:
+                    field_value += event.data
+                    if not event.more_data:
+                        form[part_name] = field_value.decode('utf-8', errors='replace')
+            event = decoder.next_event()
+        if isinstance(event, Epilogue) or not data:
+            return
+
+def start_video_processing(upload, options):
+    """
+    Start processing an upload that may still be arriving: queued as a job with async=true,
+    otherwise on a thread the request waits for. mode=analytics runs process_video_analytics
+    (no output video) instead of process_video_upload. Returns None when the job queue is full,
+    raises RegionConfigError for an unknown camera_id or invalid roi / tiling options,
+    MotionConfigError / SamplingConfigError for invalid motion gating / adaptive sampling options
+    """
+    detection_args = {
+        'confidence_threshold': float(options.get('confidence_threshold', 0.5)),
+        'batch_size': int(options.get('batch_size', VIDEO_BATCH_SIZE)),
+        'region': detection_region(options),
+        'motion_gate': video_motion_gate(options),
+        'decode_width': int(options.get('decode_width', VIDEO_DECODE_WIDTH)),
+    }
+    if str(options.get('mode', '')).lower() == 'analytics':
+        process = process_video_analytics
+        detection_args['samples_per_second'] = float(options.get('samples_per_second', ANALYTICS_SAMPLES_PER_SECOND))
+    else:
+        process = process_video_upload
+        detection_args['sample_rate'] = int(options.get('sample_rate', 5))
+        detection_args['sampler'] = SampleRateController.from_config(options, detection_args['sample_rate'],
+                                                                      ADAPTIVE_MAX_SAMPLE_RATE)
+    
+    if options.get('async', 'false').lower() in ('1', 'true', 'yes'):
+        job_id = submit_video_job(upload, process, detection_args)
+        return None if job_id is None else {'job_id': job_id}
+    
+    outcome = {}
+    
+    def run():
+        try:
+            outcome['result'] = process(upload, **detection_args)
+        except Exception as e:
+            outcome['error'] = e
+    
+    thread = threading.Thread(target=run, name='video-upload', daemon=True)
+    thread.start()
+    return {'thread': thread, 'outcome': outcome}
+
+@app.route('/api/detect-video', methods=['POST'])
+def detect_video():
+    """
+    Detect helmet in video
+    Body: multipart/form-data with a 'video' file, or the raw video bytes with options in the query string
+    The upload is streamed to disk and files that are not a known video container are rejected
+    after the first bytes. Streamable containers (MKV/WebM, AVI, MPEG-TS, faststart MP4, ...) are
+    decoded while the upload is still arriving, for multipart bodies when the form fields come before
+    the video. With async=true the video is queued and a job id is returned (poll /api/jobs/<id>).
+    camera_id (or roi / tiled options) restricts detection to ROI polygons and tiles the frames.
+    mode=analytics returns counts and per-sample detections at samples_per_second without a video.
+    motion_gate=diff|mog2 (motion_threshold, ...) reuses the previous detections on static samples.
+    target_fps or deadline (x clip duration) adapts sample_rate to the measured inference latency
+    """
+    unavailable = model_unavailable()
+    if unavailable is not None:
+        return unavailable
+    
+    upload = VideoUpload()
+    form = {}
+    processing = None
+    
+    def options():
+        return {**request.args.to_dict(), **form}
+    
+    try:
+        for chunk in iter_video_upload(form):
+            upload.append(chunk)
+            if upload.container is None and upload.bytes_received >= UPLOAD_SNIFF_BYTES:
+                if not upload.sniff():
+                    upload.discard()
+                    return jsonify({'error': 'Unsupported or unreadable video format'}), 415
+                # Options are final once the video starts: query string, or form fields sent before it
+                if request.mimetype != 'multipart/form-data' or form:
+                    processing = start_video_processing(upload, options())
+                    if processing is None:
+                        upload.discard()
+                        return jsonify({'error': 'Video job queue is full, try again later'}), 503
+            if upload.cancelled is not None:
+                break
+        
+        if upload.cancelled is not None:
+            # Processing rejected the video before the upload finished
+            upload.finish(error=upload.cancelled)
+            return jsonify({'error': upload.cancelled}), 422
+        
+        if upload.bytes_received == 0:
+            upload.discard()
+            return jsonify({'error': 'No video provided'}), 400
+        
+        if upload.container is None and not upload.sniff():
+            upload.discard()
+            return jsonify({'error': 'Unsupported or unreadable video format'}), 415
+        
+        upload.finish()
+        if processing is None:
+            processing = start_video_processing(upload, options())
+            if processing is None:
+                os.unlink(upload.path)
+                return jsonify({'error': 'Video job queue is full, try again later'}), 503
+        
+        if 'job_id' in processing:
+            job_id = processing['job_id']
+            return jsonify({
+                'job_id': job_id,
+                'state': video_jobs[job_id]['state'],
+                'status_url': f"/api/jobs/{job_id}"
+            }), 202
+        
+        processing['thread'].join()
+        error = processing['outcome'].get('error')
+        if isinstance(error, VideoDecodeError):
+            return jsonify({'error': str(error)}), 422
+        if error is not None:
+            raise error
+        return jsonify(processing['outcome']['result'])
+    
+    except (RegionConfigError, MotionConfigError, SamplingConfigError) as e:
+        # Raised by start_video_processing, before any processing owns the upload
+        upload.discard()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in detect_video: {e}")
+        # Cleanup on error (processing removes the temp file itself once it has the upload)
+        if processing is None:
+            upload.discard()
+        elif not upload.complete:
+            upload.finish(error=str(e))
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_video_job(job_id):
+    """Get state, progress and (when done) result of an async video job"""
+    job = video_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(serialize_video_job(job))
+
+@app.route('/api/batching-stats', methods=['GET'])
+def get_batching_stats():
+    """Micro-batching latency (p50/p95) and batch size metrics for /api/detect-image"""
+    if image_batcher is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **image_batcher.stats()})
+
+@app.route('/api/cache-stats', methods=['GET'])
+def get_cache_stats():
+    """Hit/miss counters and size of the image (memory) and video (disk) result caches"""
+    return jsonify({
+        'model_version': MODEL_VERSION,
+        'image': image_result_cache.stats(),
+        'video': video_result_cache.stats(),
+    })
+
 @app.route('/api/models', methods=['GET'])
 def get_models():
     """Get information about available models"""
@@ -445,65 +2561,250 @@ def get_models():
         'models': [
             {
                 'name': 'helmet_balanced',
-                'path': 'results/helmet_balanced/weights/best.pt',
-                'status': 'loaded' if model is not None else 'not_loaded'
+                'backend': backend,
+                'path': str(path),
+                'available': path.exists(),
+                'status': 'loaded' if model is not None and model_backend == backend else 'not_loaded'
             }
+            for backend, path in MODEL_PATHS.items()
         ]
     })
 
+def multi_range_response(file_path, ranges, file_size, etag, last_modified):
+    """
+    Streamed multipart/byteranges response for a Range header with several ranges
+    Parts are read in VIDEO_CHUNK_SIZE chunks, so memory stays bounded whatever the range sizes
+    """
+    spans = []
+    for start, stop in ranges:
+        if start < 0:
+            # Suffix range "-N": the last N bytes
+            start, stop = max(file_size + start, 0), file_size
+        else:
+            stop = file_size if stop is None else min(stop, file_size)
+        if start < stop:
+            spans.append((start, stop))
+    
+    if not spans:
+        return Response(status=416, headers={'Content-Range': f'bytes */{file_size}'})
+    
+    boundary = uuid.uuid4().hex
+    part_headers = [
+        (f"\r\n--{boundary}\r\nContent-Type: video/mp4\r\n"
+         f"Content-Range: bytes {start}-{stop - 1}/{file_size}\r\n\r\n").encode('ascii')
+        for start, stop in spans
+    ]
+    closing = f"\r\n--{boundary}--\r\n".encode('ascii')
+    
+    def generate():
+        with open(file_path, 'rb') as f:
+            for header, (start, stop) in zip(part_headers, spans):
+                yield header
+                f.seek(start)
+                remaining = stop - start
+                while remaining > 0:
+                    chunk = f.read(min(VIDEO_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        return
+                    remaining -= len(chunk)
+                    yield chunk
+            yield closing
+    
+    response = Response(generate(), 206, mimetype=f'multipart/byteranges; boundary={boundary}',
+                        direct_passthrough=True)
+    response.content_length = (sum(len(header) for header in part_headers)
+                               + sum(stop - start for start, stop in spans) + len(closing))
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.accept_ranges = 'bytes'
+    response.cache_control.public = True
+    response.cache_control.max_age = VIDEO_OUTPUT_TTL
+    return response
+
 @app.route('/api/video/<filename>', methods=['GET'])
 def serve_video(filename):
-    """Serve processed video file with proper headers for streaming"""
+    """
+    Serve processed video file with range and conditional request support
+    Single ranges (including suffix "bytes=-N" and open-ended "bytes=N-"), If-None-Match and
+    If-Modified-Since are handled by send_file, which streams the file in chunks (sendfile when
+    the WSGI server provides wsgi.file_wrapper); multi-range requests get multipart/byteranges
+    """
     try:
-        file_path = TEMP_VIDEO_DIR / filename
-        if not file_path.exists():
+        file_path = safe_join(str(TEMP_VIDEO_DIR.resolve()), filename)
+        if file_path is None or not os.path.isfile(file_path):
             return jsonify({'error': 'Video not found'}), 404
         
-        # Get file size for range requests
-        file_size = os.path.getsize(file_path)
+        # Output files are never rewritten in place, mtime + size identify the content
+        stat = os.stat(file_path)
+        etag = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
         
-        # Handle range requests for video seeking
-        range_header = request.headers.get('Range', None)
+        byte_range = parse_range_header(request.headers.get('Range'))
+        if byte_range is not None and len(byte_range.ranges) > 1:
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+            # A stale If-Range falls through to send_file, which answers with the full file
+            if_range = request.if_range
+            if if_range.etag is None and if_range.date is None or if_range.etag == etag:
+                return multi_range_response(file_path, byte_range.ranges, stat.st_size, etag, stat.st_mtime)
         
-        if range_header:
-            # Parse range header
-            byte_range = range_header.replace('bytes=', '').split('-')
-            start = int(byte_range[0]) if byte_range[0] else 0
-            end = int(byte_range[1]) if len(byte_range) > 1 and byte_range[1] else file_size - 1
-            
-            # Read the requested range
-            with open(file_path, 'rb') as f:
-                f.seek(start)
-                data = f.read(end - start + 1)
-            
-            # Create response with partial content
-            response = Response(
-                data,
-                206,  # Partial Content
-                mimetype='video/mp4',
-                direct_passthrough=True
-            )
-            response.headers.add('Content-Range', f'bytes {start}-{end}/{file_size}')
-            response.headers.add('Accept-Ranges', 'bytes')
-            response.headers.add('Content-Length', str(len(data)))
-            response.headers.add('Cache-Control', 'no-cache')
-            return response
-        else:
-            # Serve entire file
-            response = send_file(
-                str(file_path),
-                mimetype='video/mp4',
-                as_attachment=False,
-                download_name=filename
-            )
-            response.headers.add('Accept-Ranges', 'bytes')
-            response.headers.add('Content-Length', str(file_size))
-            response.headers.add('Cache-Control', 'no-cache')
-            return response
-            
+        return send_file(
+            file_path,
+            mimetype='video/mp4',
+            as_attachment=False,
+            download_name=filename,
+            conditional=True,
+            etag=etag,
+            last_modified=stat.st_mtime,
+            max_age=VIDEO_OUTPUT_TTL
+        )
+    
+    except HTTPException:
+        # 416 Range Not Satisfiable from send_file
+        raise
     except Exception as e:
         logger.error(f"Error serving video: {e}")
         return jsonify({'error': str(e)}), 500
 
+def clean_temp_videos(now=None):
+    """
+    Delete processed videos older than VIDEO_OUTPUT_TTL, then the oldest ones until
+    TEMP_VIDEO_DIR fits in VIDEO_DIR_MAX_MB. Returns (deleted_count, freed_bytes)
+    """
+    now = now or time.time()
+    videos = []
+    for path in TEMP_VIDEO_DIR.glob('video_*.mp4'):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        videos.append((stat.st_mtime, path, stat.st_size))
+    videos.sort(key=lambda video: video[0])
+    
+    max_bytes = VIDEO_DIR_MAX_MB * 1024 * 1024
+    total = sum(size for _, _, size in videos)
+    deleted, freed = 0, 0
+    for mtime, path, size in videos:
+        age = now - mtime
+        expired = VIDEO_OUTPUT_TTL > 0 and age > VIDEO_OUTPUT_TTL
+        over_quota = max_bytes > 0 and total > max_bytes and age > VIDEO_JANITOR_GRACE
+        if not (expired or over_quota):
+            continue
+        try:
+            path.unlink()
+        except OSError:
+            continue
+        total -= size
+        deleted += 1
+        freed += size
+    return deleted, freed
+
+def video_janitor_loop():
+    """Background eviction of processed videos (cache entries pointing to them are dropped on lookup)"""
+    while True:
+        try:
+            deleted, freed = clean_temp_videos()
+            if deleted:
+                logger.info(f"🧹 Removed {deleted} processed videos ({freed / 1024**2:.1f} MB)")
+        except Exception as e:
+            logger.warning(f"⚠️ Video janitor failed: {e}")
+        time.sleep(VIDEO_JANITOR_INTERVAL)
+
+def warm_up_model(runs=WARMUP_RUNS, size=WARMUP_IMAGE_SIZE):
+    """Dummy forward passes so the first real request does not pay graph/allocator warm-up"""
+    dummy = np.zeros((size, size, 3), dtype=np.uint8)
+    with inference_lock:
+        for _ in range(runs):
+            model.predict(dummy, verbose=False)
+
+def start_inference_workers():
+    """
+    Spawn INFERENCE_WORKERS model processes (they warm up themselves)
+    Returns (pool, backend, model_path), Nones if the workers could not start
+    """
+    backend = MODEL_BACKEND if MODEL_BACKEND in MODEL_PATHS else 'pytorch'
+    if not MODEL_PATHS[backend].exists():
+        logger.warning(f"⚠️ {backend} model not found at {MODEL_PATHS[backend]}, using pytorch")
+        backend = 'pytorch'
+    path = MODEL_PATHS[backend]
+    # Split the cores between workers so their thread pools don't oversubscribe the CPU
+    threads = INFERENCE_THREADS or max(1, (os.cpu_count() or 1) // INFERENCE_WORKERS)
+    
+    try:
+        logger.info(f"Starting {INFERENCE_WORKERS} inference workers ({threads} threads each) for {path}...")
+        pool = InferenceWorkerPool(path, INFERENCE_WORKERS, threads, warmup_runs=WARMUP_RUNS)
+        logger.info("✅ Inference workers ready")
+        return pool, backend, path
+    except Exception as e:
+        logger.error(f"❌ Inference workers failed, loading the model in-process: {e}")
+        return None, None, None
+
+def initialize_model():
+    """Load and warm up the model (or start the inference workers), then mark the backend ready"""
+    global model, model_backend, model_path, MODEL_VERSION, inference_lock
+    
+    start = time.perf_counter()
+    loaded_model = None
+    if INFERENCE_WORKERS > 0:
+        loaded_model, loaded_backend, loaded_path = start_inference_workers()
+    if loaded_model is None:
+        loaded_model, loaded_backend, loaded_path = load_detection_model()
+    startup_timings['model_load'] = round(time.perf_counter() - start, 3)
+    
+    if isinstance(loaded_model, InferenceWorkerPool):
+        MODEL_VERSION = compute_model_version(loaded_model)
+        model, model_backend, model_path = loaded_model, loaded_backend, loaded_path
+        inference_lock = contextlib.nullcontext()
+    elif loaded_model is not None:
+        MODEL_VERSION = compute_model_version(loaded_model)
+        model, model_backend, model_path = loaded_model, loaded_backend, loaded_path
+        
+        start = time.perf_counter()
+        try:
+            warm_up_model()
+        except Exception as e:
+            logger.warning(f"⚠️ Model warm-up failed: {e}")
+        startup_timings['warmup'] = round(time.perf_counter() - start, 3)
+    
+    startup_timings['ready'] = round(time.perf_counter() - _startup_started, 3)
+    model_ready.set()
+    logger.info(f"🚀 Backend ready in {startup_timings['ready']}s, timings: {startup_timings}")
+
+_backend_start_lock = threading.Lock()
+_backend_started = False
+
+def start_backend():
+    """
+    Start the micro-batcher, probe FFmpeg off the critical path and load the model according
+    to STARTUP_MODE. Runs once per process, later calls (e.g. from benchmark scripts) do nothing
+    """
+    global image_batcher, _backend_started
+    with _backend_start_lock:
+        if _backend_started:
+            return
+        _backend_started = True
+    
+    if IMAGE_MICRO_BATCHING:
+        image_batcher = MicroBatcher(IMAGE_BATCH_MAX_SIZE, IMAGE_BATCH_MAX_WAIT_MS, num_dispatchers=INFERENCE_WORKERS)
+    
+    threading.Thread(target=ffmpeg_available, name='ffmpeg-probe', daemon=True).start()
+    threading.Thread(target=video_janitor_loop, name='video-janitor', daemon=True).start()
+    
+    if STARTUP_MODE == 'background':
+        threading.Thread(target=initialize_model, name='model-startup', daemon=True).start()
+    else:
+        initialize_model()
+
+# Every importer serves (python app_backend.py, gunicorn app_backend:app, flask run); spawned
+# inference workers re-import this script as __mp_main__ and must not start a second backend
+if __name__ != '__mp_main__' and mp.parent_process() is None:
+    start_backend()
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    port = int(os.environ.get('PORT', 5000))
+    if INFERENCE_WORKERS > 0:
+        # Production serving: the debug reloader would start a second set of workers
+        app.run(host='0.0.0.0', port=port, threaded=True)
+    else:
+        app.run(debug=True, host='0.0.0.0', port=port)
\ No newline at end of file
@@ -5,8 +5,13 @@ from pathlib import Path
 from PIL import Image
 import tempfile
 import os
+import time
 from ultralytics import YOLO
 import pandas as pd
+from video_tracking import UniqueObjectCounter, interpolate_tracks, observed_tracks
+from annotation import BoxStyle, draw_boxes, draw_results, result_arrays
+from motion_gating import MotionGate
+from adaptive_sampling import SampleRateController
 
 # Set page config
 st.set_page_config(
@@ -77,6 +82,18 @@ CLASS_NAMES = {
     2: "Motorcycle"
 }
 
+# Gaya label; box tracking lebih tebal untuk visibilitas
+BOX_STYLE = BoxStyle(CLASS_NAMES, CLASS_COLORS)
+TRACK_BOX_STYLE = BoxStyle(CLASS_NAMES, CLASS_COLORS, font_scale=0.7, box_thickness=3,
+                           label_height=30, label_offset=8)
+
+# Key hitungan unik hasil video
+COUNT_KEYS = {
+    0: "with_helmet",
+    1: "no_helmet",
+    2: "motorcycle"
+}
+
 def detect_in_image(image, model, confidence_threshold=0.5):
     """Deteksi helmet dalam gambar"""
     results = model.predict(image, conf=confidence_threshold, verbose=False)
@@ -91,20 +108,14 @@ def detect_in_image(image, model, confidence_threshold=0.5):
     
     # Process detections
     for result in results:
-        boxes = result.boxes
-        for box in boxes:
-            cls_id = int(box.cls[0].item())
-            conf = box.conf[0].item()
-            
-            if cls_id == 0:
-                detections['with_helmet'] += 1
-                detections['total_riders'] += 1
-            elif cls_id == 1:
-                detections['no_helmet'] += 1
-                detections['total_riders'] += 1
-            elif cls_id == 2:
-                detections['motorcycle'] += 1
-            
+        _, classes, confs, _ = result_arrays(result)
+        counts = np.bincount(classes, minlength=3)
+        detections['with_helmet'] += int(counts[0])
+        detections['no_helmet'] += int(counts[1])
+        detections['motorcycle'] += int(counts[2])
+        detections['total_riders'] += int(counts[0] + counts[1])
+        
+        for cls_id, conf in zip(classes.tolist(), confs.tolist()):
             detections['details'].append({
                 'class': CLASS_NAMES[cls_id],
                 'confidence': f"{conf:.2%}"
@@ -113,59 +124,20 @@ def detect_in_image(image, model, confidence_threshold=0.5):
     return detections, results
 
 def draw_detections(image, results):
-    """Gambarkan bounding box dan label pada gambar"""
-    annotated_frame = image.copy()
-    
-    for result in results:
-        boxes = result.boxes
-        for box in boxes:
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-            cls_id = int(box.cls[0].item())
-            conf = box.conf[0].item()
-            
-            color = CLASS_COLORS.get(cls_id, (255, 255, 255))
-            
-            # Draw bounding box
-            cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), color, 2)
-            
-            # Draw label
-            label = f"{CLASS_NAMES[cls_id]} {conf:.2%}"
-            text_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)[0]
-            cv2.rectangle(annotated_frame, (x1, y1 - 25), (x1 + text_size[0], y1), color, -1)
-            cv2.putText(annotated_frame, label, (x1, y1 - 5), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-    
-    return annotated_frame
+    """Gambarkan bounding box dan label pada salinan gambar"""
+    return draw_results(image.copy(), BOX_STYLE, results)
 
 def draw_tracked_detections(image, results):
-    """Gambarkan bounding box dengan tracking ID untuk stabilitas"""
-    annotated_frame = image.copy()
-    
-    for result in results:
-        boxes = result.boxes
-        for box in boxes:
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-            cls_id = int(box.cls[0].item())
-            conf = box.conf[0].item()
-            track_id = int(box.id[0].item()) if box.id is not None else -1
-            
-            color = CLASS_COLORS.get(cls_id, (255, 255, 255))
-            
-            # Draw bounding box dengan lebih tebal untuk visibilitas tracking
-            cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), color, 3)
-            
-            # Draw label dengan tracking ID
-            if track_id >= 0:
-                label = f"ID:{track_id} {CLASS_NAMES[cls_id]} {conf:.2%}"
-            else:
-                label = f"{CLASS_NAMES[cls_id]} {conf:.2%}"
-            
-            text_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)[0]
-            cv2.rectangle(annotated_frame, (x1, y1 - 30), (x1 + text_size[0], y1), color, -1)
-            cv2.putText(annotated_frame, label, (x1, y1 - 8), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+    """Gambarkan bounding box dengan tracking ID langsung pada frame (frame tidak dipakai lagi)"""
+    return draw_results(image, TRACK_BOX_STYLE, results)
+
+def tracker_track_buffer(tracker='bytetrack.yaml'):
+    """Jumlah update tracker Ultralytics selama track yang hilang masih bisa muncul lagi dengan ID sama"""
+    from ultralytics.utils.checks import check_yaml
+    import yaml
     
-    return annotated_frame
+    with open(check_yaml(tracker)) as f:
+        return int(yaml.safe_load(f).get('track_buffer', 30))
 
 def analyze_safety_compliance(with_helmet, no_helmet, total_riders):
     """Analisis compliance keselamatan"""
@@ -189,17 +161,20 @@ def analyze_safety_compliance(with_helmet, no_helmet, total_riders):
     
     return status, color, compliance_rate
 
-def process_video(video_path, model, confidence_threshold=0.5, sample_rate=5):
-    """Proses video dan deteksi helmet dengan tracking untuk menghindari flicker"""
+def process_video(video_path, model, confidence_threshold=0.5, sample_rate=5, motion_gate=None, sampler=None):
+    """
+    Proses video dan deteksi helmet dengan tracking untuk menghindari flicker
+    Model hanya dijalankan (sekali, lewat model.track) pada setiap sample_rate frame; box di frame
+    antaranya diinterpolasi dari track. Setiap objek dihitung sekali per tracking ID (kelas mayoritas)
+    Dengan motion_gate (MotionGate), sample tanpa gerakan memakai ulang hasil deteksi sebelumnya
+    Dengan sampler (SampleRateController), jarak antar sample diatur ulang dari latensi inferensi
+    yang terukur agar target FPS / deadline tercapai
+    """
     cap = cv2.VideoCapture(video_path)
     
     frame_count = 0
     detected_frames = 0
-    total_detections = {
-        'with_helmet': 0,
-        'no_helmet': 0,
-        'motorcycle': 0,
-    }
+    inference_count = 0
     
     fps = cap.get(cv2.CAP_PROP_FPS)
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
@@ -214,10 +189,29 @@ def process_video(video_path, model, confidence_threshold=0.5, sample_rate=5):
     progress_bar = st.progress(0)
     status_text = st.empty()
     
-    # Track object IDs untuk menghindari flicker
-    tracked_objects = {}
-    frame_with_tracking = None
-    
+    # Track object IDs untuk menghindari flicker; ID tracker Ultralytics tidak dipakai ulang,
+    # track yang lama tidak terlihat ditutup agar memori hanya sebanding track aktif. model.track
+    # hanya dipanggil tiap sample, jadi ByteTrack menyimpan track yang hilang selama track_buffer
+    # sample; counter baru menutupnya setelah itu agar ID yang muncul lagi tidak dihitung dua kali
+    track_rate = sampler.max_rate if sampler is not None else sample_rate
+    counter = UniqueObjectCounter(COUNT_KEYS, fps, max_age=track_rate * (tracker_track_buffer() + 1))
+    # Track di sample terakhir dan frame yang menunggu sample berikutnya untuk interpolasi
+    previous = None
+    held_frames = []
+    results = None
+    if motion_gate is not None:
+        motion_gate.reset()
+    next_sample = 1
+    if sampler is not None:
+        sampler.start(fps, total_frames)
+    
+    def write_held_frames(current):
+        for held_index, held_frame in held_frames:
+            boxes, confs, classes, track_ids = interpolate_tracks(previous, current, held_index)
+            out.write(draw_boxes(held_frame, TRACK_BOX_STYLE, boxes, classes, confs, track_ids))
+        held_frames.clear()
+    
+    start_time = time.perf_counter()
     while cap.isOpened():
         ret, frame = cap.read()
         if not ret:
@@ -225,35 +219,53 @@ def process_video(video_path, model, confidence_threshold=0.5, sample_rate=5):
         
         frame_count += 1
         
-        # Run tracking on every frame untuk stabilitas, tapi hanya deteksi setiap sample_rate
-        if frame_count % sample_rate == 0 or frame_count == 1:
-            # Gunakan track() instead of predict() untuk mendapatkan tracking IDs
-            results = model.track(frame, conf=confidence_threshold, persist=True, verbose=False)
-            
-            detections, _ = detect_in_image(frame, model, confidence_threshold)
-            annotated_frame = draw_tracked_detections(frame, results)
+        # Satu inferensi (track) per sample_rate frame, frame lain tidak menyentuh model
+        if sampler is None:
+            is_sampled = frame_count % sample_rate == 0 or frame_count == 1
+        else:
+            is_sampled = frame_count >= next_sample
+            if is_sampled:
+                next_sample = frame_count + sampler.sample_rate
+        
+        if is_sampled:
+            if sampler is not None:
+                sampler.observe_sample()
+            # Frame statis (tanpa gerakan) memakai hasil track sample sebelumnya
+            if motion_gate is None or motion_gate.check(frame) or results is None:
+                inference_start = time.perf_counter()
+                results = model.track(frame, conf=confidence_threshold, persist=True, verbose=False)
+                inference_count += 1
+                if sampler is not None:
+                    sampler.observe_inference(time.perf_counter() - inference_start)
             
-            total_detections['with_helmet'] += detections['with_helmet']
-            total_detections['no_helmet'] += detections['no_helmet']
-            total_detections['motorcycle'] += detections['motorcycle']
+            xyxy, classes, confs, track_ids = result_arrays(results[0])
+            current = (frame_count, {})
+            if track_ids is not None:
+                counter.observe(frame_count, track_ids, classes, confs)
+                current = (frame_count, observed_tracks(previous, frame_count, track_ids, xyxy, confs, classes))
             
-            if detections['total_riders'] > 0:
+            if np.isin(classes, (0, 1)).any():
                 detected_frames += 1
             
-            frame_with_tracking = annotated_frame
+            write_held_frames(current)
+            previous = current
+            out.write(draw_tracked_detections(frame, results))
+        elif previous is not None:
+            held_frames.append((frame_count, frame))
         else:
-            # Gunakan frame yang sudah di-track dari sebelumnya untuk mencegah flicker
-            if frame_with_tracking is not None:
-                # Lakukan lightweight tracking untuk stabilitas
-                results = model.track(frame, conf=confidence_threshold, persist=True, verbose=False)
-                annotated_frame = draw_tracked_detections(frame, results)
-            else:
-                annotated_frame = frame.copy()
+            out.write(frame)
+        if sampler is not None:
+            sampler.update(frame_count)
         
-        out.write(annotated_frame)
+        processing_fps = frame_count / max(time.perf_counter() - start_time, 1e-9)
         progress = min(int((frame_count / total_frames) * 100), 100)
         progress_bar.progress(progress)
-        status_text.text(f"Processing frame {frame_count}/{total_frames}...")
+        status_text.text(f"Processing frame {frame_count}/{total_frames}... ({processing_fps:.1f} FPS)")
+    
+    # Frame setelah sample terakhir mengikuti kecepatan track
+    if previous is not None:
+        write_held_frames(None)
+    elapsed = time.perf_counter() - start_time
     
     cap.release()
     out.release()
@@ -261,7 +273,16 @@ def process_video(video_path, model, confidence_threshold=0.5, sample_rate=5):
     progress_bar.progress(100)
     status_text.text("✅ Video processing selesai!")
     
-    return output_path, total_detections, detected_frames
+    speed = {
+        'frames': frame_count,
+        'inferences': inference_count,
+        'seconds': elapsed,
+        'fps': frame_count / elapsed if elapsed > 0 else 0.0,
+        'motion': motion_gate.stats() if motion_gate is not None else None,
+        'adaptive': sampler.stats(frame_count) if sampler is not None else None,
+    }
+    unique_counts, tracks = counter.finish()
+    return output_path, unique_counts, tracks, detected_frames, speed
 
 # Main app
 st.markdown("<h1 class='header'>🏍️ Helmet Detection System</h1>", unsafe_allow_html=True)
@@ -361,28 +382,65 @@ with tab2:
                 tmp_video_path = tmp_file.name
             
             sample_rate = st.slider("Sample Rate (process every N frames)", 1, 10, 5)
+            motion_method = st.selectbox("Motion Gating (lewati inferensi saat frame statis)", ["off", "diff", "mog2"])
+            motion_threshold = st.slider("Motion Threshold (% piksel berubah)", 0.0, 5.0, 0.2, 0.05,
+                                         disabled=motion_method == "off")
+            adaptive_mode = st.selectbox("Adaptive Sample Rate", ["off", "Target FPS", "Deadline (x durasi video)"])
+            adaptive_target = st.number_input("Target FPS / Deadline", 0.1, 240.0,
+                                              1.0 if adaptive_mode.startswith("Deadline") else 30.0,
+                                              disabled=adaptive_mode == "off")
             
             if st.button("🎬 Start Video Detection", type="primary"):
+                motion_gate = None
+                if motion_method != "off":
+                    motion_gate = MotionGate(motion_method, threshold=motion_threshold / 100)
+                sampler = None
+                if adaptive_mode == "Target FPS":
+                    sampler = SampleRateController(sample_rate, target_fps=adaptive_target)
+                elif adaptive_mode != "off":
+                    sampler = SampleRateController(sample_rate, deadline=adaptive_target)
+                
                 with st.spinner("🔄 Processing video... (ini mungkin butuh waktu)"):
-                    output_video_path, total_detections, detected_frames = process_video(
-                        tmp_video_path, model, confidence_threshold, sample_rate
+                    output_video_path, total_detections, tracks, detected_frames, speed = process_video(
+                        tmp_video_path, model, confidence_threshold, sample_rate, motion_gate, sampler
                     )
                 
                 st.success("✅ Video processing selesai!")
                 
+                # Kecepatan proses
+                col_s1, col_s2, col_s3 = st.columns(3)
+                with col_s1:
+                    st.metric("⚡ Kecepatan", f"{speed['fps']:.1f} FPS")
+                with col_s2:
+                    st.metric("🧠 Inferensi Model", f"{speed['inferences']}/{speed['frames']} frame")
+                with col_s3:
+                    st.metric("⏱️ Waktu Proses", f"{speed['seconds']:.1f} s")
+                if speed['motion'] is not None:
+                    st.caption(f"Motion gating: {speed['motion']['skipped_samples']}/{speed['motion']['checked_samples']} "
+                               f"sample statis dilewati ({speed['motion']['skipped_fraction']:.0%})")
+                if speed['adaptive'] is not None:
+                    adaptive = speed['adaptive']
+                    with st.expander(f"⚙️ Adaptive sample rate: {adaptive['initial_sample_rate']} → "
+                                     f"{adaptive['final_sample_rate']} (rata-rata {adaptive['average_sample_rate']}, "
+                                     f"{adaptive['inferred_samples']}/{adaptive['sampled_frames']} sample diinferensi)"):
+                        if adaptive['decisions']:
+                            st.dataframe(pd.DataFrame(adaptive['decisions']), use_container_width=True, hide_index=True)
+                        else:
+                            st.write("Sample rate awal sudah memenuhi target")
+                
                 # Display results
                 st.subheader("📊 Video Analysis Results")
                 
                 col_v1, col_v2, col_v3 = st.columns(3)
                 
                 with col_v1:
-                    st.metric("👤 With Helmet (Total)", total_detections['with_helmet'])
+                    st.metric("👤 With Helmet (Unik)", total_detections['with_helmet'])
                 
                 with col_v2:
-                    st.metric("❌ No Helmet (Total)", total_detections['no_helmet'])
+                    st.metric("❌ No Helmet (Unik)", total_detections['no_helmet'])
                 
                 with col_v3:
-                    st.metric("🏍️ Motorcycle (Total)", total_detections['motorcycle'])
+                    st.metric("🏍️ Motorcycle (Unik)", total_detections['motorcycle'])
                 
                 st.divider()
                 
@@ -405,6 +463,14 @@ with tab2:
                 else:
                     st.info("ℹ️ Tidak ada pengendara yang terdeteksi dalam video")
                 
+                # Satu baris per objek yang di-track
+                if tracks:
+                    st.subheader("🔍 Objek Terdeteksi")
+                    df_tracks = pd.DataFrame(tracks)
+                    df_tracks['class'] = df_tracks['class'].map(
+                        {key: CLASS_NAMES[cls_id] for cls_id, key in COUNT_KEYS.items()})
+                    st.dataframe(df_tracks, use_container_width=True, hide_index=True)
+                
                 # Download processed video
                 with open(output_video_path, 'rb') as f:
                     st.download_button(
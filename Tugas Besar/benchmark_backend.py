@@ -0,0 +1,273 @@
+import os
+import time
+import base64
+import subprocess
+import tempfile
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+import app_backend
+
+def start_backend():
+    """Start app_backend (a no-op when the import already did) and wait for the model, False if none loaded"""
+    app_backend.start_backend()
+    app_backend.model_ready.wait()
+    return app_backend.model is not None
+
+def make_synthetic_clip(path, num_frames=120, width=1280, height=720, fps=30):
+    """Generate a synthetic clip with moving blobs as benchmark input"""
+    fourcc = cv2.VideoWriter_fourcc(*'XVID')
+    out = cv2.VideoWriter(str(path), fourcc, fps, (width, height))
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+
+    for i in range(num_frames):
+        frame = background.copy()
+        for j in range(6):
+            x = (i * (4 + j) + j * 180) % (width - 120)
+            y = 100 + j * 90
+            cv2.rectangle(frame, (x, y), (x + 120, y + 80), (40 * j, 255 - 40 * j, 128), -1)
+        out.write(frame)
+
+    out.release()
+    return path
+
+def make_1080p_clip(path, seconds=10, fps=30):
+    """1080p H.264 test clip (FFmpeg testsrc2), or a synthetic XVID clip when FFmpeg is missing"""
+    if app_backend.ffmpeg_available():
+        subprocess.run([
+            'ffmpeg', '-y', '-hide_banner', '-loglevel', 'error',
+            '-f', 'lavfi', '-i', f'testsrc2=size=1920x1080:rate={fps}', '-t', str(seconds),
+            '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', str(path)
+        ], check=True)
+        return path
+    return make_synthetic_clip(Path(path).with_suffix('.avi'), num_frames=seconds * fps,
+                               width=1920, height=1080, fps=fps)
+
+def benchmark_video_decode(seconds=10, sample_rate=5, decode_width=640):
+    """Decode cost per second of 1080p footage: full-res OpenCV reads vs grab() and FFmpeg scaled decoding"""
+    print("\n" + "="*60)
+    print("📼 VIDEO DECODE BENCHMARK")
+    print("="*60)
+    
+    tmp_dir = Path(tempfile.mkdtemp())
+    clip_path = make_1080p_clip(tmp_dir / "decode_1080p.mp4", seconds=seconds)
+    print(f"📼 Clip: {clip_path.name}, {seconds}s 1920x1080 @ 30 fps, sample_rate={sample_rate}")
+    
+    def open_opencv():
+        return cv2.VideoCapture(str(clip_path))
+    
+    modes = [
+        # (name, opener, grab skipped frames)
+        ('opencv read all', open_opencv, False),
+        ('opencv grab skipped', open_opencv, True),
+    ]
+    if app_backend.ffmpeg_available():
+        modes += [
+            ('ffmpeg full res', lambda: app_backend.FFmpegPipeReader(clip_path), False),
+            (f'ffmpeg scale {decode_width}', lambda: app_backend.FFmpegPipeReader(clip_path, max_width=decode_width), False),
+            (f'ffmpeg scale {decode_width} + grab',
+             lambda: app_backend.FFmpegPipeReader(clip_path, max_width=decode_width), True),
+        ]
+        if app_backend.VIDEO_HWACCEL:
+            modes.append((f'ffmpeg {app_backend.VIDEO_HWACCEL} scale {decode_width}',
+                          lambda: app_backend.FFmpegPipeReader(clip_path, max_width=decode_width,
+                                                               hwaccel=app_backend.VIDEO_HWACCEL), False))
+    
+    results = {}
+    for name, opener, grab_skipped in modes:
+        cpu_start = os.times()
+        wall_start = time.perf_counter()
+        cap = opener()
+        frames = 0
+        while True:
+            frames += 1
+            if grab_skipped and frames % sample_rate != 0 and frames != 1:
+                ok = cap.grab()
+            else:
+                ok, _ = cap.read()
+            if not ok:
+                break
+        cap.release()
+        wall = time.perf_counter() - wall_start
+        cpu_end = os.times()
+        # FFmpeg runs as a child process, its CPU time counts once it has been waited for
+        cpu = sum(cpu_end[i] - cpu_start[i] for i in range(4))
+        results[name] = (wall / seconds * 1000, cpu / seconds * 1000)
+        print(f"  - {name:<28}: {wall / seconds * 1000:7.1f} ms wall | {cpu / seconds * 1000:7.1f} ms CPU "
+              f"per second of video ({frames - 1} frames)")
+    
+    baseline = results['opencv read all'][0]
+    print("\n📊 SPEED-UP vs opencv read all (wall):")
+    for name, (wall_ms, _) in results.items():
+        print(f"  - {name:<28}: {baseline / wall_ms if wall_ms else 0:.2f}x")
+    
+    try:
+        os.unlink(clip_path)
+    except OSError:
+        pass
+    print("="*60)
+    return results
+
+def benchmark_video_batch(batch_sizes=(1, 4, 8, 16), sample_rate=1, num_frames=120):
+    """Compare video throughput (frames/sec) for several batch sizes"""
+    print("\n" + "="*60)
+    print("🎬 VIDEO BATCH INFERENCE BENCHMARK")
+    print("="*60)
+
+    if not start_backend():
+        print("❌ Model not loaded")
+        return
+
+    tmp_dir = Path(tempfile.mkdtemp())
+    clip_path = make_synthetic_clip(tmp_dir / "synthetic.avi", num_frames=num_frames)
+    output_path = tmp_dir / "output.avi"
+    print(f"📼 Synthetic clip: {num_frames} frames 1280x720, sample_rate={sample_rate}")
+
+    # Warm-up so the first measured run does not pay model initialisation
+    app_backend.run_video_detection(clip_path, output_path, sample_rate=sample_rate, batch_size=1)
+
+    results = []
+    for batch_size in batch_sizes:
+        start = time.perf_counter()
+        stats = app_backend.run_video_detection(
+            clip_path, output_path, sample_rate=sample_rate, batch_size=batch_size
+        )
+        elapsed = time.perf_counter() - start
+        fps = stats['total_frames'] / elapsed if elapsed > 0 else 0.0
+        results.append((batch_size, elapsed, fps))
+        print(f"  - batch {batch_size:>2}: {elapsed:6.2f}s | {fps:6.1f} frames/sec")
+
+    baseline_fps = results[0][2]
+    print("\n📊 SPEED-UP vs batch 1:")
+    for batch_size, _, fps in results:
+        print(f"  - batch {batch_size:>2}: {fps / baseline_fps if baseline_fps else 0:.2f}x")
+
+    for path in (clip_path, output_path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    print("="*60)
+    return results
+
+def benchmark_boxes_mode(image_path='results/test_inference.jpg', iterations=30):
+    """Compare server time per /api/detect-image request: annotated image vs boxes-only mode"""
+    print("\n" + "="*60)
+    print("📦 DETECTIONS-ONLY (mode=boxes) BENCHMARK")
+    print("="*60)
+
+    # /api/detect-image answers 503 until model_ready is set
+    if not start_backend():
+        print("❌ Model not loaded")
+        return
+
+    with open(image_path, 'rb') as f:
+        image_base64 = "data:image/jpeg;base64," + base64.b64encode(f.read()).decode('utf-8')
+    print(f"🖼️ Image: {image_path} | {iterations} requests per mode")
+
+    # The same image is posted every time: keep the result cache out so every request runs the model
+    app_backend.image_result_cache.max_entries = 0
+    client = app_backend.app.test_client()
+    modes = {
+        'annotated': {'image': image_base64, 'confidence_threshold': 0.5},
+        'boxes': {'image': image_base64, 'confidence_threshold': 0.5, 'mode': 'boxes'},
+    }
+
+    # Warm-up
+    client.post('/api/detect-image', json=modes['annotated'])
+
+    results = {}
+    for name, payload in modes.items():
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        response_bytes = 0
+        for _ in range(iterations):
+            response = client.post('/api/detect-image', json=payload)
+            response_bytes += len(response.data)
+        wall_ms = (time.perf_counter() - wall_start) / iterations * 1000
+        cpu_ms = (time.process_time() - cpu_start) / iterations * 1000
+        results[name] = (wall_ms, cpu_ms, response_bytes / iterations)
+        print(f"  - {name:<9}: {wall_ms:7.1f} ms wall | {cpu_ms:7.1f} ms CPU | {response_bytes / iterations / 1024:8.1f} KB response")
+
+    saved_cpu = results['annotated'][1] - results['boxes'][1]
+    print(f"\n📊 CPU saved per request: {saved_cpu:.1f} ms "
+          f"({saved_cpu / results['annotated'][1] * 100 if results['annotated'][1] else 0:.1f}%)")
+    print("="*60)
+    return results
+
+def benchmark_inference_backends(image_path='results/test_inference.jpg', iterations=50,
+                                 backends=('pytorch', 'onnx', 'onnx_int8', 'openvino')):
+    """Compare single-image latency of each exported model backend (see MODEL_BACKEND)"""
+    print("\n" + "="*60)
+    print("🧠 INFERENCE BACKEND BENCHMARK")
+    print("="*60)
+
+    image = cv2.imread(image_path)
+    if image is None:
+        print(f"❌ Cannot read {image_path}")
+        return
+    print(f"🖼️ Image: {image_path} | {iterations} runs per backend | threads: "
+          f"{app_backend.INFERENCE_THREADS or 'default'}")
+
+    results = {}
+    for backend in backends:
+        model_path = app_backend.MODEL_PATHS[backend]
+        if not model_path.exists():
+            print(f"  - {backend:<9}: skipped ({model_path} not found, export it with training.py option 6 or quantize_model.py)")
+            continue
+
+        model, loaded_backend, _ = app_backend.load_detection_model(backend)
+        if model is None or loaded_backend != backend:
+            print(f"  - {backend:<9}: failed to load")
+            continue
+
+        # Warm-up
+        for _ in range(3):
+            model.predict(image, verbose=False)
+
+        latencies = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            model.predict(image, verbose=False)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        latencies = np.array(latencies)
+        results[backend] = latencies
+        print(f"  - {backend:<9}: mean {latencies.mean():6.1f} ms | p50 {np.percentile(latencies, 50):6.1f} ms"
+              f" | p95 {np.percentile(latencies, 95):6.1f} ms")
+
+    if 'pytorch' in results:
+        baseline = results['pytorch'].mean()
+        print("\n📊 SPEED-UP vs pytorch:")
+        for backend, latencies in results.items():
+            print(f"  - {backend:<9}: {baseline / latencies.mean():.2f}x")
+    print("="*60)
+    return results
+
+if __name__ == "__main__":
+    print("\n" + "="*60)
+    print("⏱️ BACKEND BENCHMARKS")
+    print("="*60)
+
+    print("Choose benchmark:")
+    print("1. 🎬 Video batch inference (batch 1/4/8/16)")
+    print("2. 📦 Detections-only image response (mode=boxes)")
+    print("3. 🧠 Inference backends (PyTorch / ONNX / ONNX INT8 / OpenVINO)")
+    print("4. 📼 Video decode cost (1080p, OpenCV vs grab() vs FFmpeg scaled / hwaccel)")
+    print("5. Exit")
+    
+    choice = input("\nChoice (1-5): ").strip()
+
+    if choice == '1':
+        benchmark_video_batch()
+    elif choice == '2':
+        benchmark_boxes_mode()
+    elif choice == '3':
+        benchmark_inference_backends()
+    elif choice == '4':
+        benchmark_video_decode()
+    else:
+        print("Exiting...")
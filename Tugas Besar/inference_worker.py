@@ -0,0 +1,187 @@
+"""
+Multi-process inference workers for app_backend.py (INFERENCE_WORKERS > 0)
+Each worker process loads its own copy of the model with a pinned thread count and takes
+predict tasks from one shared queue, so concurrent requests run on separate CPU cores
+"""
+
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+
+import numpy as np
+
+def set_inference_threads(model, model_path, threads):
+    """
+    Pin torch and, for ONNX / OpenVINO models, the ONNX Runtime session or the OpenVINO compiled
+    model to `threads` intra-op threads
+    """
+    import torch
+    torch.set_num_threads(threads)
+    is_onnx = str(model_path).endswith('.onnx')
+    is_openvino = str(model_path).endswith('_openvino_model')
+    if not is_onnx and not is_openvino:
+        return
+    
+    # Ultralytics creates the ONNX Runtime session / OpenVINO compiled model on the first predict
+    model.predict(np.zeros((64, 64, 3), dtype=np.uint8), verbose=False)
+    autobackend = model.predictor.model
+    owner = getattr(autobackend, 'backend', autobackend)
+    
+    if is_openvino:
+        import openvino as ov
+        
+        # OpenVINO ignores torch.set_num_threads: recompile on the CPU with INFERENCE_NUM_THREADS
+        core = ov.Core()
+        config = {'PERFORMANCE_HINT': 'LATENCY', 'INFERENCE_NUM_THREADS': threads}
+        xml = next(Path(model_path).glob('*.xml'))
+        owner.ov_compiled_model = core.compile_model(core.read_model(str(xml)), 'CPU', config)
+        if hasattr(owner, 'compile_model'):
+            # Used by Ultralytics to recompile static-shape models per input size
+            owner.compile_model = lambda ov_model: core.compile_model(ov_model, 'CPU', config)
+        return
+    
+    import onnxruntime as ort
+    
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = threads
+    owner.session = ort.InferenceSession(str(model_path), options, providers=owner.session.get_providers())
+
+def worker_main(worker_id, model_path, threads, warmup_runs, task_queue, result_queue):
+    """Worker process: load the model, warm it up, then serve (task_id, images, conf) tasks until None"""
+    # Keep OpenMP/MKL pools from spawning one thread per core in every worker
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[var] = str(threads)
+    
+    try:
+        import torch
+        torch.set_num_interop_threads(1)
+        _original_torch_load = torch.load
+        def patched_torch_load(f, *args, **kwargs):
+            kwargs.setdefault('weights_only', False)
+            return _original_torch_load(f, *args, **kwargs)
+        torch.load = patched_torch_load
+        
+        from ultralytics import YOLO
+        model = YOLO(str(model_path), task='detect')
+        set_inference_threads(model, model_path, threads)
+        
+        dummy = np.zeros((640, 640, 3), dtype=np.uint8)
+        for _ in range(warmup_runs):
+            model.predict(dummy, verbose=False)
+    except Exception as e:
+        result_queue.put(('failed', worker_id, repr(e)))
+        return
+    
+    result_queue.put(('ready', worker_id, dict(model.names)))
+    
+    parent = mp.parent_process()
+    while True:
+        try:
+            task = task_queue.get(timeout=1)
+        except queue.Empty:
+            # Exit with the Flask process even if it was killed without closing the pool
+            if parent is not None and not parent.is_alive():
+                break
+            continue
+        if task is None:
+            break
+        task_id, images, conf = task
+        try:
+            results = model.predict(images, conf=conf, verbose=False)
+            # Only the N x 6 box tensors travel back, the front-end rebuilds Results around its own images
+            result_queue.put((task_id, [result.boxes.data.cpu().numpy() for result in results], None))
+        except Exception as e:
+            result_queue.put((task_id, None, repr(e)))
+
+class InferenceWorkerPool:
+    """
+    Front-end of the worker processes with the subset of the YOLO API app_backend uses:
+    predict(source, conf, verbose) returns a list of ultralytics Results
+    """
+    
+    def __init__(self, model_path, num_workers, threads_per_worker, warmup_runs=2, task_timeout=300,
+                 startup_timeout=300):
+        self.ckpt_path = str(model_path)
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker
+        self.task_timeout = task_timeout
+        self.names = None
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        self.task_ids = itertools.count()
+        
+        context = mp.get_context('spawn')
+        self.task_queue = context.Queue()
+        self.result_queue = context.Queue()
+        self.processes = [
+            context.Process(
+                target=worker_main,
+                args=(worker_id, str(model_path), threads_per_worker, warmup_runs,
+                      self.task_queue, self.result_queue),
+                name=f'inference-worker-{worker_id}',
+                daemon=True,
+            )
+            for worker_id in range(num_workers)
+        ]
+        for process in self.processes:
+            process.start()
+        
+        for _ in range(num_workers):
+            status, worker_id, payload = self.result_queue.get(timeout=startup_timeout)
+            if status != 'ready':
+                self.close()
+                raise RuntimeError(f"Inference worker {worker_id} failed to start: {payload}")
+            self.names = payload
+        
+        self.collector = threading.Thread(target=self._collect_results, name='inference-results', daemon=True)
+        self.collector.start()
+    
+    def _collect_results(self):
+        while True:
+            task_id, boxes, error = self.result_queue.get()
+            with self.pending_lock:
+                future = self.pending.pop(task_id, None)
+            if future is None:
+                continue
+            if error is not None:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(boxes)
+    
+    def predict(self, source, conf=0.25, verbose=False):
+        """Run one predict task on the next free worker, blocks until its results are back"""
+        import torch
+        from ultralytics.engine.results import Results
+        
+        images = source if isinstance(source, list) else [source]
+        task_id = next(self.task_ids)
+        future = Future()
+        with self.pending_lock:
+            self.pending[task_id] = future
+        self.task_queue.put((task_id, images, conf))
+        
+        try:
+            boxes = future.result(timeout=self.task_timeout)
+        finally:
+            with self.pending_lock:
+                self.pending.pop(task_id, None)
+        
+        return [
+            Results(orig_img=image, path='', names=self.names, boxes=torch.from_numpy(data))
+            for image, data in zip(images, boxes)
+        ]
+    
+    def alive_workers(self):
+        return sum(1 for process in self.processes if process.is_alive())
+    
+    def close(self):
+        for _ in self.processes:
+            self.task_queue.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
@@ -0,0 +1,136 @@
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+# Load test settings
+IMAGE_PATH = Path("results/test_inference.jpg")
+BASE_PORT = 5100
+DURATION = 20          # seconds of load per worker count
+CONCURRENCY_PER_WORKER = 4
+STARTUP_TIMEOUT = 300
+
+def start_server(workers, port):
+    """Start app_backend.py in production mode with `workers` inference processes"""
+    env = dict(
+        os.environ,
+        INFERENCE_WORKERS=str(workers),
+        PORT=str(port),
+        IMAGE_CACHE_SIZE='0',  # every request must reach the model
+    )
+    return subprocess.Popen(
+        [sys.executable, 'app_backend.py'], env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+def wait_until_ready(port, timeout=STARTUP_TIMEOUT):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health/ready", timeout=2) as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(1)
+    return False
+
+def post_image(url, image_bytes):
+    """One /api/detect-image request (boxes only), returns latency in seconds or None on error"""
+    request = urllib.request.Request(url, data=image_bytes, headers={'Content-Type': 'image/jpeg'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            response.read()
+        return time.perf_counter() - start
+    except (urllib.error.URLError, ConnectionError):
+        return None
+
+def run_load(port, image_bytes, concurrency, duration=DURATION):
+    """Keep `concurrency` requests in flight for `duration` seconds"""
+    url = f"http://127.0.0.1:{port}/api/detect-image?mode=boxes"
+    deadline = time.perf_counter() + duration
+    
+    def client_loop():
+        latencies, errors = [], 0
+        while time.perf_counter() < deadline:
+            latency = post_image(url, image_bytes)
+            if latency is None:
+                errors += 1
+            else:
+                latencies.append(latency)
+        return latencies, errors
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(lambda _: client_loop(), range(concurrency)))
+    elapsed = time.perf_counter() - start
+    
+    latencies = np.array([latency for client, _ in outcomes for latency in client]) * 1000
+    errors = sum(errors for _, errors in outcomes)
+    return {
+        'requests': int(latencies.size),
+        'errors': errors,
+        'throughput_rps': round(latencies.size / elapsed, 2),
+        'latency_p50_ms': round(float(np.percentile(latencies, 50)), 1) if latencies.size else None,
+        'latency_p95_ms': round(float(np.percentile(latencies, 95)), 1) if latencies.size else None,
+    }
+
+def load_test(max_workers):
+    """Measure /api/detect-image throughput with 1..max_workers inference worker processes"""
+    print("="*70)
+    print("🔥 INFERENCE WORKERS LOAD TEST")
+    print("="*70)
+    
+    if not IMAGE_PATH.exists():
+        print(f"❌ Test image not found: {IMAGE_PATH}")
+        return
+    
+    image_bytes = IMAGE_PATH.read_bytes()
+    print(f"🖼️ Image: {IMAGE_PATH} | {DURATION}s per run | {CONCURRENCY_PER_WORKER} clients per worker")
+    print(f"💻 CPU cores: {os.cpu_count()}")
+    
+    results = {}
+    for workers in range(1, max_workers + 1):
+        port = BASE_PORT + workers
+        server = start_server(workers, port)
+        try:
+            if not wait_until_ready(port):
+                print(f"  - {workers} worker(s): server did not become ready")
+                continue
+            stats = run_load(port, image_bytes, CONCURRENCY_PER_WORKER * workers)
+            results[workers] = stats
+            print(f"  - {workers} worker(s): {stats['throughput_rps']:6.2f} req/s | "
+                  f"p50 {stats['latency_p50_ms']} ms | p95 {stats['latency_p95_ms']} ms | "
+                  f"errors {stats['errors']}")
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+    
+    if 1 in results and results[1]['throughput_rps']:
+        baseline = results[1]['throughput_rps']
+        print("\n📊 SCALING vs 1 worker:")
+        for workers, stats in results.items():
+            print(f"  - {workers} worker(s): {stats['throughput_rps'] / baseline:.2f}x")
+    
+    report_path = Path("results/load_test_report.json")
+    with open(report_path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n📄 Report saved: {report_path}")
+    print("="*70)
+    return results
+
+if __name__ == "__main__":
+    default_workers = max(1, min(4, os.cpu_count() or 1))
+    answer = input(f"Max inference workers to test (default {default_workers}): ").strip()
+    load_test(int(answer) if answer else default_workers)
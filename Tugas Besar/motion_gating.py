@@ -0,0 +1,132 @@
+"""
+Motion gating for the sampled-frame video pipelines in app_backend.py and app_helmet.py
+Before a sampled frame goes to the detector, a small blurred grayscale copy of it is compared
+with the scene: against the last inferred frame ('diff') or against a MOG2 background model
+('mog2'). When too little of the frame changed, the caller reuses the previous detections, so
+a fixed camera looking at an empty road costs a resize and a subtraction per sample instead of
+a forward pass
+"""
+
+import json
+
+import cv2
+import numpy as np
+
+MOTION_METHODS = ('diff', 'mog2')
+
+class MotionConfigError(ValueError):
+    """Invalid motion gating settings"""
+
+class MotionGate:
+    """
+    Per-run motion gate, check(frame) is True when the detector has to run on the frame
+    A frame triggers inference when more than threshold of its pixels changed by more than
+    pixel_threshold grey levels (for 'mog2': were classified as foreground with pixel_threshold
+    as the variance threshold), when it is the first frame, or after max_skip skipped samples in
+    a row so slow changes and new objects are never missed for long
+    """
+    
+    def __init__(self, method='diff', threshold=0.002, pixel_threshold=25, width=320, max_skip=25):
+        if method not in MOTION_METHODS:
+            raise MotionConfigError(f"motion_gate must be one of {', '.join(MOTION_METHODS)} or off")
+        if not 0 <= threshold < 1:
+            raise MotionConfigError('motion_threshold is a fraction of the frame, in [0, 1)')
+        if not 0 < pixel_threshold < 256:
+            raise MotionConfigError('motion_pixel_threshold must be in (0, 256)')
+        if width < 16:
+            raise MotionConfigError('Motion gating width must be at least 16 pixels')
+        if max_skip < 0:
+            raise MotionConfigError('motion_max_skip must not be negative')
+        self.method = method
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.width = width
+        self.max_skip = max_skip
+        self.reset()
+    
+    @classmethod
+    def from_config(cls, config):
+        """
+        Gate from a request options dict (motion_gate, motion_threshold, motion_pixel_threshold,
+        motion_max_skip, motion_width), None when motion_gate is off
+        """
+        method = str(config.get('motion_gate', 'off')).lower()
+        if method in ('', 'off', 'none', 'false', '0'):
+            return None
+        try:
+            return cls(
+                method=method,
+                threshold=float(config.get('motion_threshold', 0.002)),
+                pixel_threshold=float(config.get('motion_pixel_threshold', 25)),
+                width=int(config.get('motion_width', 320)),
+                max_skip=int(config.get('motion_max_skip', 25)),
+            )
+        except (TypeError, ValueError) as e:
+            if isinstance(e, MotionConfigError):
+                raise
+            raise MotionConfigError(f"Invalid motion gating settings: {e}")
+    
+    def reset(self):
+        """Forget the scene and the counters, called at the start of every video run"""
+        self.reference = None
+        self.subtractor = None
+        self.skip_run = 0
+        self.checked = 0
+        self.skipped = 0
+        self.last_motion = 1.0
+    
+    def describe(self):
+        """JSON-friendly settings, also used in result cache keys"""
+        return {
+            'method': self.method,
+            'threshold': self.threshold,
+            'pixel_threshold': self.pixel_threshold,
+            'width': self.width,
+            'max_skip': self.max_skip,
+        }
+    
+    def key(self):
+        return json.dumps(self.describe(), sort_keys=True, separators=(',', ':'))
+    
+    def _small_gray(self, frame):
+        height, width = frame.shape[:2]
+        if width > self.width:
+            frame = cv2.resize(frame, (self.width, max(round(height * self.width / width), 1)),
+                               interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        # Blur away sensor noise and compression blocks before differencing
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+    
+    def check(self, frame):
+        """Whether the detector has to run on this sampled BGR frame (False: reuse the previous detections)"""
+        small = self._small_gray(frame)
+        self.checked += 1
+        
+        if self.method == 'mog2':
+            if self.subtractor is None:
+                self.subtractor = cv2.createBackgroundSubtractorMOG2(
+                    history=100, varThreshold=self.pixel_threshold, detectShadows=False)
+            changed = np.count_nonzero(self.subtractor.apply(small))
+        elif self.reference is not None:
+            changed = np.count_nonzero(cv2.absdiff(small, self.reference) > self.pixel_threshold)
+        else:
+            changed = small.size
+        self.last_motion = changed / small.size
+        
+        if self.reference is not None and self.last_motion <= self.threshold and self.skip_run < self.max_skip:
+            self.skip_run += 1
+            self.skipped += 1
+            return False
+        
+        self.reference = small
+        self.skip_run = 0
+        return True
+    
+    def stats(self):
+        """Settings plus checked / skipped sample counts of the current run"""
+        return {
+            **self.describe(),
+            'checked_samples': self.checked,
+            'skipped_samples': self.skipped,
+            'skipped_fraction': round(self.skipped / self.checked, 4) if self.checked else 0.0,
+        }
@@ -0,0 +1,193 @@
+import json
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import onnx
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    CalibrationMethod,
+    QuantFormat,
+    QuantType,
+    quantize_static,
+)
+from ultralytics import YOLO
+
+from training import export_model, quick_test
+
+# Define paths
+WEIGHTS_DIR = Path("results/helmet_balanced/weights")
+FP32_PT = WEIGHTS_DIR / "best.pt"
+FP32_ONNX = WEIGHTS_DIR / "best.onnx"
+INT8_ONNX = WEIGHTS_DIR / "best_int8.onnx"
+REPORT_PATH = WEIGHTS_DIR / "quantization_report.json"
+CALIBRATION_DIR = Path("datasets/detect-helmet/images/val")
+BENCHMARK_IMAGE = Path("results/test_inference.jpg")
+
+CALIBRATION_IMAGES = 200
+IMAGE_SIZE = 640
+LATENCY_RUNS = 50
+
+def letterbox(image, size=IMAGE_SIZE):
+    """Resize + pad like the Ultralytics predictor, returns NCHW float32 RGB in [0, 1]"""
+    height, width = image.shape[:2]
+    scale = min(size / height, size / width)
+    new_w, new_h = int(round(width * scale)), int(round(height * scale))
+    resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    top, left = (size - new_h) // 2, (size - new_w) // 2
+    canvas[top:top + new_h, left:left + new_w] = resized
+
+    tensor = canvas[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255.0
+    return tensor[np.newaxis]
+
+class HelmetCalibrationReader(CalibrationDataReader):
+    """Feed a random sample of validation images to the ONNX Runtime calibrator"""
+
+    def __init__(self, onnx_path, image_dir, num_images=CALIBRATION_IMAGES, seed=0):
+        self.input_name = onnx.load(str(onnx_path)).graph.input[0].name
+        images = sorted(p for p in Path(image_dir).iterdir() if p.suffix.lower() in ('.jpg', '.jpeg', '.png', '.bmp'))
+        random.Random(seed).shuffle(images)
+        self.images = images[:num_images]
+        self.index = 0
+
+    def get_next(self):
+        while self.index < len(self.images):
+            image = cv2.imread(str(self.images[self.index]))
+            self.index += 1
+            if image is not None:
+                return {self.input_name: letterbox(image)}
+        return None
+
+def detect_head_nodes(onnx_path):
+    """
+    Box-decode nodes of the Detect head (last /model.N/ block, outside the cv2/cv3 conv branches)
+    Keeping the DFL / anchor / concat math in FP32 avoids most of the mAP drop of a fully quantized YOLO graph
+    """
+    graph = onnx.load(str(onnx_path)).graph
+    indices = [int(match.group(1)) for node in graph.node if (match := re.match(r'/model\.(\d+)/', node.name))]
+    if not indices:
+        return []
+    head_prefix = f"/model.{max(indices)}/"
+    return [
+        node.name for node in graph.node
+        if node.name.startswith(head_prefix) and not re.match(rf'{head_prefix}cv\d', node.name)
+    ]
+
+def measure_latency(weights, image, runs=LATENCY_RUNS):
+    """Mean single-image predict latency in ms"""
+    model = YOLO(str(weights), task='detect')
+    for _ in range(3):
+        model.predict(image, verbose=False)
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        model.predict(image, verbose=False)
+    return (time.perf_counter() - start) / runs * 1000
+
+def quantize_model():
+    """
+    Calibrate, quantize to INT8 and compare accuracy / latency / size with the FP32 model
+    Returns the report, None when a step fails
+    """
+    print("="*70)
+    print("🧮 INT8 POST-TRAINING QUANTIZATION")
+    print("="*70)
+
+    if not FP32_PT.exists():
+        print(f"❌ No trained model found at {FP32_PT}. Run training first!")
+        return
+
+    if not FP32_ONNX.exists():
+        print("\n📦 FP32 ONNX model not found, exporting...")
+        exported = export_model(('onnx',))
+        if 'onnx' not in exported or not FP32_ONNX.exists():
+            print(f"❌ ONNX export failed, {FP32_ONNX} is missing. Nothing to quantize")
+            return
+
+    if not CALIBRATION_DIR.exists():
+        print(f"❌ Calibration images not found: {CALIBRATION_DIR}")
+        return
+
+    reader = HelmetCalibrationReader(FP32_ONNX, CALIBRATION_DIR)
+    excluded_nodes = detect_head_nodes(FP32_ONNX)
+    print(f"\n🔄 Calibrating on {len(reader.images)} images from {CALIBRATION_DIR}...")
+    print(f"   Keeping {len(excluded_nodes)} Detect head decode nodes in FP32")
+
+    quantize_static(
+        str(FP32_ONNX),
+        str(INT8_ONNX),
+        reader,
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        calibrate_method=CalibrationMethod.MinMax,
+        nodes_to_exclude=excluded_nodes,
+    )
+    print(f"✅ INT8 model saved: {INT8_ONNX}")
+
+    # Accuracy (same flow as training.py quick test)
+    fp32_metrics = quick_test(FP32_PT)
+    int8_metrics = quick_test(INT8_ONNX)
+    if fp32_metrics is None or int8_metrics is None:
+        failed = ', '.join(str(weights) for weights, metrics in ((FP32_PT, fp32_metrics), (INT8_ONNX, int8_metrics))
+                           if metrics is None)
+        print(f"❌ Validation failed for {failed}, accuracy cannot be compared")
+        return
+
+    # Latency
+    image = cv2.imread(str(BENCHMARK_IMAGE))
+    latency = {}
+    if image is not None:
+        for name, weights in (('fp32_pt', FP32_PT), ('fp32_onnx', FP32_ONNX), ('int8_onnx', INT8_ONNX)):
+            latency[name] = round(measure_latency(weights, image), 2)
+
+    size_mb = {
+        'fp32_onnx': round(FP32_ONNX.stat().st_size / 1024**2, 2),
+        'int8_onnx': round(INT8_ONNX.stat().st_size / 1024**2, 2),
+    }
+
+    report = {
+        'calibration_images': len(reader.images),
+        'map50': {
+            'fp32': round(float(fp32_metrics.box.map50), 4),
+            'int8': round(float(int8_metrics.box.map50), 4),
+        },
+        'map50_95': {
+            'fp32': round(float(fp32_metrics.box.map), 4),
+            'int8': round(float(int8_metrics.box.map), 4),
+        },
+        'latency_ms': latency,
+        'size_mb': size_mb,
+    }
+    report['map50']['delta'] = round(report['map50']['int8'] - report['map50']['fp32'], 4)
+    report['map50_95']['delta'] = round(report['map50_95']['int8'] - report['map50_95']['fp32'], 4)
+
+    with open(REPORT_PATH, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print("\n" + "="*70)
+    print("📊 QUANTIZATION REPORT")
+    print("="*70)
+    print(f"  - mAP50:     FP32 {report['map50']['fp32']:.3f} | INT8 {report['map50']['int8']:.3f} "
+          f"| Δ {report['map50']['delta']:+.3f}")
+    print(f"  - mAP50-95:  FP32 {report['map50_95']['fp32']:.3f} | INT8 {report['map50_95']['int8']:.3f} "
+          f"| Δ {report['map50_95']['delta']:+.3f}")
+    for name, value in latency.items():
+        print(f"  - Latency {name}: {value:.1f} ms")
+    print(f"  - Size:      FP32 {size_mb['fp32_onnx']:.1f} MB | INT8 {size_mb['int8_onnx']:.1f} MB")
+    print(f"\n📄 Report saved: {REPORT_PATH}")
+    print("💡 Start backend with: MODEL_BACKEND=onnx_int8 python app_backend.py")
+    print("="*70)
+    return report
+
+if __name__ == "__main__":
+    # Failures return None: exit non-zero so scripts / CI notice
+    if quantize_model() is None:
+        sys.exit(1)
@@ -465,18 +465,18 @@ def kill_processes():
     if not killed:
         print("\nNo training processes found")
 
-def quick_test():
-    """Quick test on validation set"""
+def quick_test(weights=None):
+    """Quick test on validation set (best.pt by default, also accepts exported/quantized models)"""
     print("\n🧪 QUICK TEST MODE")
     print("="*60)
     
-    weights = Path('./results/helmet_balanced/weights/best.pt')
+    weights = Path(weights) if weights else Path('./results/helmet_balanced/weights/best.pt')
     if not weights.exists():
         print("❌ No trained model found. Run training first!")
         return
     
     print(f"📥 Loading model: {weights}")
-    model = YOLO(str(weights))
+    model = YOLO(str(weights), task='detect')
     
     print("🔍 Running validation...")
     metrics = model.val(data='./datasets/detect-helmet/data.yaml')
@@ -501,6 +501,36 @@ def quick_test():
         for i, class_name in enumerate(class_names):
             if i < len(metrics.box.ap):
                 print(f"  - {class_name}: {metrics.box.ap[i]:.3f}")
+    
+    return metrics
+
+def export_model(formats=('onnx', 'openvino')):
+    """Export trained model for CPU inference backends (MODEL_BACKEND in app_backend.py)"""
+    print("\n📦 EXPORT MODE")
+    print("="*60)
+    
+    weights = Path('./results/helmet_balanced/weights/best.pt')
+    if not weights.exists():
+        print("❌ No trained model found. Run training first!")
+        return {}
+    
+    print(f"📥 Loading model: {weights}")
+    model = YOLO(str(weights))
+    
+    exported_paths = {}
+    for fmt in formats:
+        print(f"\n🔄 Exporting to {fmt}...")
+        try:
+            # dynamic=True: backend runs batched video/image inference
+            export_args = {'simplify': True} if fmt == 'onnx' else {}
+            exported = model.export(format=fmt, imgsz=640, dynamic=True, **export_args)
+            exported_paths[fmt] = Path(exported)
+            print(f"✅ Exported: {exported}")
+        except Exception as e:
+            print(f"❌ Export to {fmt} failed: {e}")
+    
+    print("\n💡 Start backend with: MODEL_BACKEND=onnx python app_backend.py")
+    return exported_paths
 
 if __name__ == "__main__":
     print("\n" + "="*60)
@@ -519,9 +549,10 @@ if __name__ == "__main__":
     print("3. 🔍 Diagnose Stuck Training")
     print("4. ☠️ Kill Stuck Processes")
     print("5. 🔍 Quick Test Model")
-    print("6. Exit")
+    print("6. 📦 Export Model (ONNX/OpenVINO)")
+    print("7. Exit")
     
-    choice = input("\nChoice (1-6): ").strip()
+    choice = input("\nChoice (1-7): ").strip()
     
     if choice == '1':
         resume_training_with_mode()
@@ -533,5 +564,7 @@ if __name__ == "__main__":
         kill_processes()
     elif choice == '5':
         quick_test()
+    elif choice == '6':
+        export_model()
     else:
         print("Exiting...")
\ No newline at end of file
@@ -0,0 +1,235 @@
+"""
+Lightweight box tracking for the video pipeline in app_backend.py
+Detections of the sampled frames are linked into tracks by IoU against a constant-velocity
+prediction, and the boxes of the skipped frames in between are interpolated from those tracks,
+so every frame gets a smooth overlay while only one frame in sample_rate is inferred
+"""
+
+import itertools
+
+import numpy as np
+
+# Classes that can be the same object in consecutive samples (a rider flickering between
+# with_helmet / no_helmet); boxes of different groups are never associated
+CLASS_GROUPS = {0: 0, 1: 0, 2: 1}
+
+def box_iou(boxes_a, boxes_b):
+    """Pairwise IoU of (N, 4) and (M, 4) xyxy boxes, returns an (N, M) matrix"""
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area_a = (boxes_a[:, 2:] - boxes_a[:, :2]).prod(axis=1)
+    area_b = (boxes_b[:, 2:] - boxes_b[:, :2]).prod(axis=1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return intersection / np.maximum(union, 1e-9)
+
+class Track:
+    """One tracked object: last observed box, per-frame box velocity, class and confidence"""
+    
+    __slots__ = ('track_id', 'box', 'velocity', 'conf', 'cls', 'last_frame', 'hits')
+    
+    def __init__(self, track_id, box, conf, cls, frame_index):
+        self.track_id = track_id
+        self.box = box
+        self.velocity = np.zeros(4, dtype=np.float32)
+        self.conf = conf
+        self.cls = cls
+        self.last_frame = frame_index
+        self.hits = 1
+    
+    def predict(self, frame_index):
+        """Box extrapolated to frame_index with the constant-velocity model"""
+        return self.box + self.velocity * (frame_index - self.last_frame)
+
+class BoxTracker:
+    """
+    IoU tracker for detections on sampled (non-consecutive) frames
+    Tracks are matched greedily by IoU between their predicted box and the new detections,
+    then the leftovers by centre distance (within distance_ratio box diagonals) for objects
+    that moved further than their own size between two samples. Velocity is an exponentially
+    smoothed box displacement per frame, so the prediction follows steady motion
+    """
+    
+    def __init__(self, iou_threshold=0.3, max_age=30, velocity_smoothing=0.5, distance_ratio=1.5):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.distance_ratio = distance_ratio
+        self.velocity_smoothing = velocity_smoothing
+        self.tracks = []
+        self.track_ids = itertools.count(1)
+    
+    def update(self, frame_index, boxes, confs, classes):
+        """
+        Associate one sampled frame's detections ((N, 4) xyxy, (N,) conf, (N,) class)
+        Returns the tracks observed on this frame as {track_id: (box, velocity, conf, cls)}
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.tracks = [track for track in self.tracks if frame_index - track.last_frame <= self.max_age]
+        
+        matches = {}
+        if self.tracks and len(boxes):
+            predicted = np.stack([track.predict(frame_index) for track in self.tracks])
+            iou = box_iou(predicted, boxes)
+            track_groups = np.array([CLASS_GROUPS.get(track.cls, -1) for track in self.tracks])
+            box_groups = np.array([CLASS_GROUPS.get(int(cls), -1) for cls in classes])
+            same_group = track_groups[:, None] == box_groups[None, :]
+            iou[~same_group] = 0
+            
+            # Greedy assignment, best overlap first
+            while True:
+                track_index, box_index = np.unravel_index(np.argmax(iou), iou.shape)
+                if iou[track_index, box_index] < self.iou_threshold:
+                    break
+                matches[box_index] = self.tracks[track_index]
+                iou[track_index, :] = 0
+                iou[:, box_index] = 0
+            
+            # Then nearest centres, in units of the track's box diagonal
+            track_centres = (predicted[:, :2] + predicted[:, 2:]) / 2
+            box_centres = (boxes[:, :2] + boxes[:, 2:]) / 2
+            diagonals = np.linalg.norm(predicted[:, 2:] - predicted[:, :2], axis=1)
+            distance = (np.linalg.norm(track_centres[:, None] - box_centres[None], axis=2)
+                        / np.maximum(diagonals[:, None], 1.0))
+            distance[~same_group] = np.inf
+            matched_tracks = [index for index, track in enumerate(self.tracks) if track in matches.values()]
+            distance[matched_tracks, :] = np.inf
+            distance[:, list(matches)] = np.inf
+            while True:
+                track_index, box_index = np.unravel_index(np.argmin(distance), distance.shape)
+                if distance[track_index, box_index] > self.distance_ratio:
+                    break
+                matches[box_index] = self.tracks[track_index]
+                distance[track_index, :] = np.inf
+                distance[:, box_index] = np.inf
+        
+        observed = {}
+        for index, (box, conf, cls) in enumerate(zip(boxes, confs, classes)):
+            track = matches.get(index)
+            if track is None:
+                track = Track(next(self.track_ids), box, float(conf), int(cls), frame_index)
+                self.tracks.append(track)
+            else:
+                displacement = (box - track.box) / max(frame_index - track.last_frame, 1)
+                if track.hits == 1:
+                    track.velocity = displacement
+                else:
+                    track.velocity = (self.velocity_smoothing * track.velocity
+                                      + (1 - self.velocity_smoothing) * displacement)
+                track.hits += 1
+                track.box, track.conf, track.cls, track.last_frame = box, float(conf), int(cls), frame_index
+            observed[track.track_id] = (track.box, track.velocity, track.conf, track.cls)
+        return observed
+
+def observed_tracks(previous, frame_index, track_ids, boxes, confs, classes):
+    """
+    BoxTracker.update-style {track_id: (box, velocity, conf, cls)} for detections that already
+    carry track IDs (e.g. model.track); velocity is measured against the previous sample
+    """
+    observed = {}
+    for track_id, box, conf, cls in zip(track_ids, np.asarray(boxes, dtype=np.float32), confs, classes):
+        velocity = np.zeros(4, dtype=np.float32)
+        if previous is not None and int(track_id) in previous[1]:
+            previous_index, previous_tracks = previous
+            velocity = (box - previous_tracks[int(track_id)][0]) / max(frame_index - previous_index, 1)
+        observed[int(track_id)] = (box, velocity, float(conf), int(cls))
+    return observed
+
+def interpolate_tracks(previous, current, frame_index):
+    """
+    Boxes for a skipped frame between two sampled frames
+    previous / current are (frame_index, observed) pairs from BoxTracker.update, current is None
+    after the last sampled frame. Tracks seen on both samples are interpolated linearly, tracks
+    that end or start in between are shown for the nearer half of the gap (extrapolated with
+    their velocity). Returns (boxes, confs, classes, track_ids) arrays
+    """
+    previous_index, previous_tracks = previous
+    if current is None:
+        current_index, current_tracks = None, {}
+        alpha = 0.0
+    else:
+        current_index, current_tracks = current
+        alpha = (frame_index - previous_index) / max(current_index - previous_index, 1)
+    
+    boxes, confs, classes, track_ids = [], [], [], []
+    for track_id in previous_tracks.keys() | current_tracks.keys():
+        before = previous_tracks.get(track_id)
+        after = current_tracks.get(track_id)
+        if before is not None and after is not None:
+            box = (1 - alpha) * before[0] + alpha * after[0]
+            conf = (1 - alpha) * before[2] + alpha * after[2]
+            cls = before[3] if alpha < 0.5 else after[3]
+        elif before is not None and (current is None or alpha < 0.5):
+            box = before[0] + before[1] * (frame_index - previous_index)
+            conf, cls = before[2], before[3]
+        elif after is not None and alpha >= 0.5:
+            box = after[0] - after[1] * (current_index - frame_index)
+            conf, cls = after[2], after[3]
+        else:
+            continue
+        boxes.append(box)
+        confs.append(conf)
+        classes.append(cls)
+        track_ids.append(track_id)
+    
+    return (
+        np.array(boxes, dtype=np.float32).reshape(-1, 4),
+        np.array(confs, dtype=np.float32),
+        np.array(classes, dtype=np.int64),
+        np.array(track_ids, dtype=np.int64),
+    )
+
+class UniqueObjectCounter:
+    """
+    Unique object counts from tracked detections instead of per-frame sums
+    An active track keeps only its class votes and first/last frame; a track that has not
+    been seen for max_age frames is closed with its majority-vote class (ties go to the
+    higher total confidence) and counted once. Every closed track leaves a small summary
+    in tracks for finish(), so memory grows with the number of tracks ever seen, not with
+    the frame count
+    """
+    
+    def __init__(self, class_names, fps, max_age=30):
+        self.class_names = class_names
+        self.fps = fps or 30
+        self.max_age = max_age
+        self.active = {}
+        self.counts = {name: 0 for name in class_names.values()}
+        self.tracks = []
+    
+    def observe(self, frame_index, track_ids, classes, confs):
+        """Add the tracked detections of one frame (frame_index counts from 1)"""
+        for track_id, cls, conf in zip(track_ids, classes, confs):
+            track_id, cls = int(track_id), int(cls)
+            track = self.active.get(track_id)
+            if track is None:
+                track = self.active[track_id] = {'votes': {}, 'first_frame': frame_index}
+            votes = track['votes'].setdefault(cls, [0, 0.0])
+            votes[0] += 1
+            votes[1] += float(conf)
+            track['last_frame'] = frame_index
+        
+        for track_id in [track_id for track_id, track in self.active.items()
+                         if frame_index - track['last_frame'] > self.max_age]:
+            self._close(track_id)
+    
+    def _close(self, track_id):
+        track = self.active.pop(track_id)
+        cls, (hits, conf_sum) = max(track['votes'].items(), key=lambda vote: (vote[1][0], vote[1][1]))
+        samples = sum(count for count, _ in track['votes'].values())
+        name = self.class_names.get(cls, 'unknown')
+        self.counts[name] = self.counts.get(name, 0) + 1
+        self.tracks.append({
+            'track_id': track_id,
+            'class': name,
+            'confidence': f"{conf_sum / hits:.2%}",
+            'first_seen_s': round((track['first_frame'] - 1) / self.fps, 2),
+            'last_seen_s': round((track['last_frame'] - 1) / self.fps, 2),
+            'samples': samples,
+        })
+    
+    def finish(self):
+        """Close the remaining tracks, returns (unique counts per class name, per-track summaries)"""
+        for track_id in list(self.active):
+            self._close(track_id)
+        self.tracks.sort(key=lambda track: (track['first_seen_s'], track['track_id']))
+        return self.counts, self.tracks